@@ -1,34 +1,132 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
+import asyncio
+import hashlib
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
 
+from app.cache import TTLCache
+from app.password_pool import PasswordHashPool, PoolSaturatedError
 from app.database import get_db
 from app.models.db_models import User
+from app.models.schemas import UserResponse
 
 #Secret key for JWT - should be in environment variables
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7 
 
+#Scope of the short-lived tokens that open GET /stream/ from a query parameter
+STREAM_SCOPE = "stream"
+STREAM_TOKEN_EXPIRE_SECONDS = int(os.getenv("STREAM_TOKEN_EXPIRE_SECONDS", "60"))
+
 #Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+#bcrypt cost: pinned with BCRYPT_ROUNDS, or measured at startup when BCRYPT_CALIBRATE is set
+BCRYPT_ROUNDS = os.getenv("BCRYPT_ROUNDS")
+BCRYPT_CALIBRATE = os.getenv("BCRYPT_CALIBRATE", "false").lower() in ("1", "true", "yes")
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "250"))
+BCRYPT_MIN_ROUNDS = int(os.getenv("BCRYPT_MIN_ROUNDS", "10"))
+BCRYPT_MAX_ROUNDS = int(os.getenv("BCRYPT_MAX_ROUNDS", "15"))
+
+def set_bcrypt_rounds(rounds: int) -> None:
+    """Make `rounds` the only accepted bcrypt cost; other hashes get rehashed on login"""
+    pwd_context.update(bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds, bcrypt__max_rounds=rounds)
+    #Exported so spawned process-pool workers pick up the same cost when they import this module
+    os.environ["BCRYPT_ROUNDS"] = str(rounds)
+
+def calibrate_bcrypt_rounds(target_ms: float, min_rounds: int, max_rounds: int) -> int:
+    """Find the highest bcrypt cost whose hash time fits target_ms on this machine"""
+    chosen = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        context = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=rounds)
+        start = time.perf_counter()
+        context.hash("calibration-password")
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms > target_ms and rounds > min_rounds:
+            break
+        chosen = rounds
+        #Each extra round doubles the work, so stop once the next one would overshoot
+        if elapsed_ms * 2 > target_ms:
+            break
+    return chosen
+
+async def configure_bcrypt_cost() -> None:
+    """Apply the configured or calibrated bcrypt cost (run once at startup)"""
+    if BCRYPT_CALIBRATE:
+        rounds = await asyncio.to_thread(calibrate_bcrypt_rounds, BCRYPT_TARGET_MS, BCRYPT_MIN_ROUNDS, BCRYPT_MAX_ROUNDS)
+        print(f"Calibrated bcrypt cost to {rounds} rounds for a {BCRYPT_TARGET_MS:.0f}ms budget")
+        set_bcrypt_rounds(rounds)
+    elif BCRYPT_ROUNDS:
+        set_bcrypt_rounds(int(BCRYPT_ROUNDS))
+
+if BCRYPT_ROUNDS:
+    set_bcrypt_rounds(int(BCRYPT_ROUNDS))
+
+#bcrypt runs off the event loop in a bounded pool; excess logins are rejected with 503
+password_pool = PasswordHashPool(
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2))),
+    max_queue=int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64")),
+    kind=os.getenv("PASSWORD_HASH_POOL", "thread"),
+)
+
 #OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+
+#Verified-principal cache: sha256(token) -> (claims, user snapshot)
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "300"))
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+
+def _token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+def invalidate_cached_user(user_id: int) -> None:
+    """Drop every cached principal for a user (call after changing their profile)"""
+    principal_cache.discard_where(lambda _, entry: entry[1].id == user_id)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash"""
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password; also returns a new hash if the stored one uses a different cost"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
 def get_password_hash(password: str) -> str:
     """Hash a password"""
     return pwd_context.hash(password)
 
+async def _run_in_password_pool(fn, *args):
+    try:
+        return await password_pool.run(fn, *args)
+    except PoolSaturatedError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password on the password pool"""
+    return await _run_in_password_pool(verify_password, plain_password, hashed_password)
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify (and possibly rehash) a password on the password pool"""
+    return await _run_in_password_pool(verify_and_update_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password on the password pool"""
+    return await _run_in_password_pool(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -40,43 +138,102 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
-    """Get the current authenticated user from JWT token"""
+def create_stream_token(user_id: int) -> str:
+    """Short-lived token that only opens the event stream; it may travel in a URL"""
+    return create_access_token(
+        data={"sub": str(user_id), "scope": STREAM_SCOPE},
+        expires_delta=timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS)
+    )
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> UserResponse:
+    """Get the current authenticated user from JWT token
+
+    Returns a read-only snapshot of the user. Verified tokens are cached, so repeat
+    requests with the same token skip both the JWT decode and the users-table lookup.
+    """
+    return await _authenticate_token(token, db, scope=None)
+
+async def get_stream_user(
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    stream_token: Optional[str] = Query(None, alias="token", description="Token from POST /stream/token"),
+    db: AsyncSession = Depends(get_db)
+) -> UserResponse:
+    """Current user from the Authorization header, or from a stream token in the query
+
+    Browser EventSource cannot send headers, so it passes a stream-scoped token as
+    ?token=; access tokens are never accepted there.
+    """
+    if token is not None:
+        return await _authenticate_token(token, db, scope=None)
+    if stream_token is not None:
+        return await _authenticate_token(stream_token, db, scope=STREAM_SCOPE)
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Not authenticated",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+async def _authenticate_token(token: str, db: AsyncSession, scope: Optional[str]) -> UserResponse:
+    """The user a token belongs to; 401 unless it is valid and carries exactly `scope`"""
+    digest = _token_digest(token)
+    cached = principal_cache.get(digest)
+    if cached is not None and cached[0].get("scope") == scope:
+        return cached[1]
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if cached is not None:
+        raise credentials_exception
+    #Stream tokens travel in URLs; nothing about them (or the key) goes to the log
+    debug = print if scope is None else (lambda message: None)
     try:
-        print(f"DEBUG: Attempting to decode token: {token[:20]}...")
-        print(f"DEBUG: Using SECRET_KEY: {SECRET_KEY[:10]}...")
+        debug(f"DEBUG: Attempting to decode token: {token[:20]}...")
+        debug(f"DEBUG: Using SECRET_KEY: {SECRET_KEY[:10]}...")
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        if payload.get("scope") != scope:
+            raise credentials_exception
         user_id_str: str = payload.get("sub")
-        print(f"DEBUG: Decoded user_id string: {user_id_str}")
+        debug(f"DEBUG: Decoded user_id string: {user_id_str}")
         if user_id_str is None:
-            print("DEBUG: user_id is None in token payload")
+            debug("DEBUG: user_id is None in token payload")
             raise credentials_exception
         user_id = int(user_id_str)
     except JWTError as e:
-        print(f"DEBUG: JWT decode error: {str(e)}")
+        debug(f"DEBUG: JWT decode error: {str(e)}")
         raise credentials_exception
     except ValueError:
-        print("DEBUG: Could not convert user_id to int")
+        debug("DEBUG: Could not convert user_id to int")
         raise credentials_exception
 
-    user = db.query(User).filter(User.id == user_id).first()
+    result = await db.execute(select(User).where(User.id == user_id))
+    user = result.scalar_one_or_none()
     if user is None:
-        print(f"DEBUG: No user found with id {user_id}")
+        debug(f"DEBUG: No user found with id {user_id}")
         raise credentials_exception
 
-    print(f"DEBUG: Successfully authenticated user {user.email}")
-    return user
+    debug(f"DEBUG: Successfully authenticated user {user.email}")
+    snapshot = UserResponse.model_validate(user)
+
+    #Never cache a principal past its token's expiry
+    expires_in = payload["exp"] - time.time() if "exp" in payload else PRINCIPAL_CACHE_TTL_SECONDS
+    principal_cache.set(digest, (payload, snapshot), ttl=expires_in)
+    return snapshot
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
+async def authenticate_user(db: AsyncSession, email: str, password: str) -> Optional[User]:
     """Authenticate a user by email and password"""
-    user = db.query(User).filter(User.email == email).first()
+    result = await db.execute(select(User).where(User.email == email))
+    user = result.scalar_one_or_none()
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await verify_and_update_password_async(password, user.hashed_password)
+    if not valid:
         return None
+
+    #Transparently move the stored hash to the current bcrypt cost
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
     return user
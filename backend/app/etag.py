@@ -0,0 +1,92 @@
+"""
+Conditional requests (ETag / If-None-Match / If-Match)
+
+Read endpoints derive an ETag from something they already have in hand (a row's
+updated_at, a plan version id, the leaderboard snapshot) and answer If-None-Match
+with an empty 304 before loading or serializing the body. Browsers do this on their
+own for fetch(): responses are marked private, no-cache, so the cached copy is
+revalidated on every use.
+
+Writes accept If-Match for optimistic concurrency: a stale tag gets 412, and the
+check is made atomic with a conditional UPDATE on the row (see claim_row).
+"""
+import hashlib
+from typing import Optional
+
+from fastapi import HTTPException, Request, Response, status
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts, weak: bool = False) -> str:
+    """Quoted entity tag for the given validator parts (same parts, same tag on every worker)"""
+    digest = hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def _tags(header: str):
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def _opaque(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def none_match(request: Request, etag: str) -> bool:
+    """True when If-None-Match already names etag (weak comparison)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return any(tag == "*" or _opaque(tag) == _opaque(etag) for tag in _tags(header))
+
+
+def conditional(request: Request, response: Response, etag: Optional[str]) -> Optional[Response]:
+    """Tag the response; returns the 304 to send instead when the client's copy is current"""
+    if etag is None:
+        return None
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if none_match(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def check_if_match(request: Request, etag: Optional[str]) -> bool:
+    """Raise 412 unless If-Match names etag (strong comparison); False when there is no If-Match
+
+    etag is None when the resource does not exist, which only If-Match-less requests accept.
+    """
+    header = request.headers.get("if-match")
+    if not header:
+        return False
+    tags = _tags(header)
+    if etag is None or not ("*" in tags or (not etag.startswith("W/") and etag in tags)):
+        raise precondition_failed()
+    return True
+
+
+def precondition_failed() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail="Resource has changed, reload and try again"
+    )
+
+
+async def claim_row(db: AsyncSession, model, where, column, expected, value=None) -> None:
+    """Compare-and-set `column` from `expected` to `value` (or to itself), or raise 412
+
+    Run after check_if_match passed. The UPDATE holds the row lock until the
+    transaction ends, so of two writers that read the same version only the first one
+    commits; the other matches no row here and gets 412.
+    """
+    matches = column.is_(None) if expected is None else column == expected
+    result = await db.execute(
+        update(model)
+        .where(where, matches)
+        .values({column.key: column if value is None else value})
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        raise precondition_failed()
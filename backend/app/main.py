@@ -4,8 +4,9 @@ from typing import List
 import uuid
 import os
 from datetime import date
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 #Load environment variables from .env file
 load_dotenv()
@@ -13,15 +14,38 @@ load_dotenv()
 from app.models.user import UserProfile
 from app.models.workout import WorkoutPlan, WorkoutDay
 from app.services.ai_workout_generator import AIWorkoutGenerator
-from app.database import engine, get_db, Base
-from app.routes import auth, progress, workouts, leaderboard
-from app.auth import get_current_user
-from app.models.db_models import User
-
-#Create database tables
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="FitQuest API")
+from app.database import engine, get_db
+from app.migrations import run_migrations
+from app.services.progress_buffer import progress_buffer
+from app.services.rank_index import rank_index
+from app.services.periods import period_compactor
+from app.services.broadcaster import broadcaster
+from app.services.plan_store import plan_store
+from app.services.inference_client import inference_client
+from app.routes import auth, progress, workouts, leaderboard, stream, ops
+from app.auth import get_current_user, password_pool, configure_bcrypt_cost
+from app.models.schemas import UserResponse
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    #Create database tables and migrate them (serialized across workers)
+    await run_migrations()
+    await configure_bcrypt_cost()
+    progress_buffer.start()
+    rank_index.start()
+    period_compactor.start()
+    broadcaster.start()
+    inference_client.start()
+    yield
+    await progress_buffer.stop()
+    await rank_index.stop()
+    await period_compactor.stop()
+    await broadcaster.stop()
+    await inference_client.stop()
+    password_pool.shutdown()
+    await engine.dispose()
+
+app = FastAPI(title="FitQuest API", lifespan=lifespan)
 
 #CORS middleware for React frontend
 frontend_url = os.getenv("FRONTEND_URL", "http://localhost:3000")
@@ -42,6 +66,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    #Lets the frontend read ETags to send back in If-Match
+    expose_headers=["ETag"],
 )
 
 #Include routers
@@ -49,34 +75,34 @@ app.include_router(auth.router)
 app.include_router(progress.router)
 app.include_router(workouts.router)
 app.include_router(leaderboard.router)
-
-#In-memory storage (replace with database later)
-workout_plans = {}
+app.include_router(stream.router)
+app.include_router(ops.router)
 
 @app.post("/generate-workout", response_model=WorkoutPlan)
 async def generate_workout_plan(
     user_profile: UserProfile,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     generator = AIWorkoutGenerator()
-    workout_plan = generator.generate_workout_plan(user_profile)
+    workout_plan = await generator.generate_workout_plan(user_profile)
 
-    #Store the plan (keeping in-memory for now, can be moved to DB later)
-    workout_plans[workout_plan.id] = workout_plan
+    #Store the plan (bounded memory tier, backed by the database)
+    await plan_store.put(db, workout_plan, current_user.id)
 
     return workout_plan
 
 @app.get("/workout/{workout_id}", response_model=WorkoutPlan)
-async def get_workout_plan(workout_id: str):
-    if workout_id not in workout_plans:
+async def get_workout_plan(workout_id: str, db: AsyncSession = Depends(get_db)):
+    workout_plan = await plan_store.get(db, workout_id)
+    if workout_plan is None:
         raise HTTPException(status_code=404, detail="Workout plan not found")
-    return workout_plans[workout_id]
+    return workout_plan
 
 @app.post("/workout/{workout_id}/complete-exercise")
-async def mark_exercise_complete(workout_id: str, day: int, exercise_name: str):
+async def mark_exercise_complete(workout_id: str, day: int, exercise_name: str, db: AsyncSession = Depends(get_db)):
     #This will be used by the React todo list functionality
-    if workout_id not in workout_plans:
+    if await plan_store.get(db, workout_id) is None:
         raise HTTPException(status_code=404, detail="Workout plan not found")
     
     #Implementation for tracking completed exercises
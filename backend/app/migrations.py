@@ -0,0 +1,341 @@
+"""
+Data migrations that run at startup after the tables are created.
+
+Every migration is idempotent, so it is safe to run on each boot. On Postgres,
+run_migrations holds an advisory lock, so workers that boot together run them one
+after another instead of racing on the same rows and DDL. SQLite has no such lock;
+start a single worker first when it has migrations to run. They can also be run by
+hand:
+    python -m app.migrations
+
+Maintenance tasks that are too heavy for every boot are run by name:
+    python -m app.migrations recompute-levels
+    python -m app.migrations compact-periods
+    python -m app.migrations purge-plan-cache
+    python -m app.migrations rebuild-period-exp
+"""
+import asyncio
+import sys
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+import numpy as np
+from sqlalchemy import delete, func, inspect, insert, select, text, update, null
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateIndex
+
+from app.database import Base, SessionLocal, engine, init_db
+from app.models.db_models import DailyActivity, ExerciseCompletion, PeriodExp, PlanContent, User, UserProgress, WorkoutPlan, WorkoutPlanVersion
+from app.services.activity import utc_today
+from app.services.completions import slots_from_dict
+from app.services.plan_history import content_values, decode_content, plan_content_hash, store_content, uses_jsonb
+from app.services.periods import PERIODS, compact_periods, oldest_retained, period_start
+from app.services.plan_cache import plan_cache
+from app.services.progression import recompute_progress_array
+
+BATCH_SIZE = 500
+
+#pg_advisory_lock key that serializes run_migrations across workers
+MIGRATION_LOCK_KEY = 0x46514D49
+
+@asynccontextmanager
+async def migration_lock():
+    """Hold the migration lock on Postgres (a session advisory lock on its own connection)"""
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            yield
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+def _add_missing_columns(conn) -> None:
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"]: column for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                if column.nullable and not existing[column.name]["nullable"] and conn.dialect.name == "postgresql":
+                    print(f"Dropping NOT NULL on {table.name}.{column.name}")
+                    conn.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN {column.name} DROP NOT NULL"))
+                continue
+            #A worker outside the migration lock (or a manual run) may have added it since we looked
+            guard = "IF NOT EXISTS " if conn.dialect.name == "postgresql" else ""
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {guard}{column.name} {column.type.compile(conn.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            print(f"Adding column {table.name}.{column.name}")
+            conn.execute(text(ddl))
+
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                print(f"Creating index {index.name}")
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+async def add_missing_columns() -> None:
+    """Add columns and indexes declared after a table was first created (create_all skips them)
+
+    On Postgres, columns that have since become nullable also lose their NOT NULL.
+    Runs under the migration lock; the DDL is IF NOT EXISTS as well, so a run that
+    lost the race to another one does not abort the boot.
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(_add_missing_columns)
+
+async def migrate_completed_exercises() -> int:
+    """Move legacy UserProgress.completed_exercises blobs into exercise_completions"""
+    migrated = 0
+    async with SessionLocal() as db:
+        while True:
+            result = await db.execute(
+                select(UserProgress.id, UserProgress.user_id, UserProgress.completed_exercises)
+                .where(UserProgress.completed_exercises.is_not(None))
+                .limit(BATCH_SIZE)
+            )
+            rows = result.all()
+            if not rows:
+                break
+
+            #Skip anything already copied by a previous (interrupted) run, for the whole batch at once
+            copied = defaultdict(set)
+            existing = await db.execute(
+                select(ExerciseCompletion.user_id, ExerciseCompletion.week, ExerciseCompletion.day, ExerciseCompletion.exercise_index)
+                .where(ExerciseCompletion.user_id.in_([user_id for _, user_id, _ in rows]))
+            )
+            for user_id, week, day, exercise_index in existing.all():
+                copied[user_id].add((week, day, exercise_index))
+
+            completions = [
+                {"user_id": user_id, "week": week, "day": day, "exercise_index": exercise_index}
+                for _, user_id, blob in rows
+                for week, day, exercise_index in sorted(slots_from_dict(blob or {}) - copied[user_id])
+            ]
+            if completions:
+                await db.execute(insert(ExerciseCompletion), completions)
+            await db.execute(
+                update(UserProgress)
+                .where(UserProgress.id.in_([progress_id for progress_id, _, _ in rows]))
+                .values(completed_exercises=null())
+            )
+            await db.commit()
+            migrated += len(rows)
+
+    if migrated:
+        print(f"Migrated completed_exercises for {migrated} users")
+    return migrated
+
+async def migrate_workout_plans() -> int:
+    """Move legacy workout_plans rows into plan_contents / workout_plan_versions
+
+    Rows without a user cannot become versions; they are left in place and counted.
+    """
+    migrated = 0
+    async with SessionLocal() as db:
+        while True:
+            legacy = list(await db.scalars(
+                select(WorkoutPlan)
+                .where(WorkoutPlan.user_id.is_not(None))
+                .order_by(WorkoutPlan.id)
+                .limit(BATCH_SIZE)
+            ))
+            if not legacy:
+                break
+
+            for plan in legacy:
+                content_hash = plan_content_hash(plan.plan_data)
+                await store_content(db, content_hash, plan.plan_data)
+                version = WorkoutPlanVersion(
+                    user_id=plan.user_id,
+                    content_hash=content_hash,
+                    week_number=plan.week_number,
+                    created_at=plan.created_at
+                )
+                db.add(version)
+                await db.flush()
+                #The legacy table kept one plan per user, which was their current one
+                await db.execute(
+                    update(User)
+                    .where(User.id == plan.user_id, User.current_workout_id.is_(None))
+                    .values(current_workout_id=version.id)
+                )
+            await db.execute(delete(WorkoutPlan).where(WorkoutPlan.id.in_([plan.id for plan in legacy])))
+            await db.commit()
+            migrated += len(legacy)
+
+        orphans = await db.scalar(select(func.count()).select_from(WorkoutPlan).where(WorkoutPlan.user_id.is_(None)))
+
+    if migrated:
+        print(f"Migrated {migrated} workout plans into versioned history")
+    if orphans:
+        print(f"Skipped {orphans} legacy workout plans with no user; they remain in workout_plans")
+    return migrated
+
+async def convert_plan_contents() -> int:
+    """Rewrite stored plans that are not in the configured PLAN_STORAGE format"""
+    converted = 0
+    async with SessionLocal() as db:
+        stale = PlanContent.packed.is_not(None) if uses_jsonb(db) else PlanContent.packed.is_(None)
+        while True:
+            result = await db.execute(
+                select(PlanContent.content_hash, PlanContent.packed, PlanContent.plan_data)
+                .where(stale)
+                .limit(BATCH_SIZE)
+            )
+            rows = result.all()
+            if not rows:
+                break
+            for content_hash, packed, plan_data in rows:
+                await db.execute(
+                    update(PlanContent)
+                    .where(PlanContent.content_hash == content_hash)
+                    .values(**content_values(db, decode_content(packed, plan_data)))
+                )
+            await db.commit()
+            converted += len(rows)
+
+    if converted:
+        print(f"Converted {converted} stored plans to {'jsonb' if uses_jsonb(db) else 'packed'} storage")
+    return converted
+
+async def _period_totals(db, since) -> list:
+    """period_exp rows summed from daily_activity, the rollup every EXP change goes through"""
+    totals = defaultdict(int)
+    result = await db.stream(
+        select(DailyActivity.user_id, DailyActivity.day, DailyActivity.exp_earned)
+        .where(DailyActivity.day >= since, DailyActivity.exp_earned != 0)
+    )
+    async for user_id, day, exp_earned in result:
+        for period in PERIODS:
+            totals[(user_id, period, period_start(period, day))] += exp_earned
+    return [
+        {"user_id": user_id, "period": period, "period_start": start, "exp_earned": exp_earned}
+        for (user_id, period, start), exp_earned in totals.items()
+    ]
+
+async def backfill_period_exp() -> int:
+    """Build weekly / monthly EXP totals from daily_activity the first time period_exp is empty"""
+    async with SessionLocal() as db:
+        if await db.scalar(select(PeriodExp.user_id).limit(1)) is not None:
+            return 0
+
+        today = utc_today()
+        rows = await _period_totals(db, min(oldest_retained(period, today) for period in PERIODS))
+        try:
+            for i in range(0, len(rows), BATCH_SIZE):
+                await db.execute(insert(PeriodExp), rows[i:i + BATCH_SIZE])
+            await db.commit()
+        except IntegrityError:
+            #Another worker backfilled at the same time
+            await db.rollback()
+            return 0
+
+    if rows:
+        print(f"Backfilled {len(rows)} weekly / monthly EXP totals")
+    return len(rows)
+
+async def rebuild_period_exp() -> int:
+    """Recompute the retained weekly / monthly EXP totals from daily_activity
+
+    Both tables are written by the same record_activity call, so this brings
+    period_exp back in line with the daily rollup, e.g. after totals were lost or
+    edited by hand. It cannot undo EXP that the daily rollup itself booked on the
+    wrong day.
+    """
+    today = utc_today()
+    oldest = {period: oldest_retained(period, today) for period in PERIODS}
+    async with SessionLocal() as db:
+        rows = [
+            row for row in await _period_totals(db, min(oldest.values()))
+            if row["period_start"] >= oldest[row["period"]]
+        ]
+        for period in PERIODS:
+            await db.execute(delete(PeriodExp).where(PeriodExp.period == period, PeriodExp.period_start >= oldest[period]))
+        for i in range(0, len(rows), BATCH_SIZE):
+            await db.execute(insert(PeriodExp), rows[i:i + BATCH_SIZE])
+        await db.commit()
+
+    print(f"Rebuilt {len(rows)} weekly / monthly EXP totals from daily activity")
+    return len(rows)
+
+async def compact_period_exp() -> int:
+    removed = await compact_periods()
+    print(f"Compacted period leaderboards, {removed} rows removed")
+    return removed
+
+async def purge_plan_cache() -> int:
+    removed = await plan_cache.purge()
+    print(f"Purged expired cached plans, {removed} rows removed")
+    return removed
+
+async def recompute_levels() -> int:
+    """Re-derive level / current_exp / exp_to_next_level for every user from their EXP"""
+    fixed = 0
+    last_id = 0
+    async with SessionLocal() as db:
+        while True:
+            result = await db.execute(
+                select(UserProgress.id, UserProgress.level, UserProgress.current_exp, UserProgress.exp_to_next_level)
+                .where(UserProgress.id > last_id)
+                .order_by(UserProgress.id)
+                .limit(BATCH_SIZE)
+            )
+            rows = result.all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            ids, levels, exps, nexts = (np.array(column, dtype=np.int64) for column in zip(*rows))
+            new_levels, new_exps, new_next = recompute_progress_array(levels, exps)
+            changed = np.nonzero((new_levels != levels) | (new_exps != exps) | (new_next != nexts))[0]
+
+            if len(changed):
+                await db.execute(update(UserProgress), [
+                    {
+                        "id": int(ids[i]),
+                        "level": int(new_levels[i]),
+                        "current_exp": int(new_exps[i]),
+                        "exp_to_next_level": int(new_next[i])
+                    }
+                    for i in changed
+                ])
+                await db.commit()
+                fixed += len(changed)
+
+    print(f"Recomputed levels, {fixed} users changed")
+    return fixed
+
+async def run_migrations() -> None:
+    """Create missing tables and run every migration, one worker at a time"""
+    async with migration_lock():
+        await init_db()
+        await _run_migrations()
+
+async def _run_migrations() -> None:
+    await add_missing_columns()
+    await migrate_completed_exercises()
+    await migrate_workout_plans()
+    await convert_plan_contents()
+    await backfill_period_exp()
+
+TASKS = {
+    "recompute-levels": recompute_levels,
+    "compact-periods": compact_period_exp,
+    "purge-plan-cache": purge_plan_cache,
+    "rebuild-period-exp": rebuild_period_exp,
+}
+
+async def _main(task_names) -> None:
+    await run_migrations()
+    for name in task_names:
+        await TASKS[name]()
+
+if __name__ == "__main__":
+    unknown = [name for name in sys.argv[1:] if name not in TASKS]
+    if unknown:
+        sys.exit(f"Unknown task(s): {', '.join(unknown)}. Available: {', '.join(TASKS)}")
+    asyncio.run(_main(sys.argv[1:]))
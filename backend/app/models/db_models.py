@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, JSON, ForeignKey, Boolean, Index, LargeBinary
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -11,6 +12,8 @@ class User(Base):
     username = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Validator for the /auth/me ETag (NULL for rows created before it existed)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=True)
 
     # User profile data
     age = Column(Integer, nullable=True)
@@ -18,9 +21,12 @@ class User(Base):
     height = Column(Float, nullable=True)
     fitness_level = Column(String, nullable=True)  # beginner, intermediate, advanced
 
+    # WorkoutPlanVersion shown by /workouts/current (no FK: versions already reference users)
+    current_workout_id = Column(Integer, nullable=True)
+
     # Relationships
     progress = relationship("UserProgress", back_populates="user", uselist=False)
-    workouts = relationship("WorkoutPlan", back_populates="user")
+    workouts = relationship("WorkoutPlanVersion", back_populates="user")
 
 class UserProgress(Base):
     __tablename__ = "user_progress"
@@ -36,16 +42,134 @@ class UserProgress(Base):
     current_week = Column(Integer, default=0)
     total_days = Column(Integer, default=0)
 
-    # Completed exercises stored as JSON
-    # Format: {"week1-day1-exercise0": true, ...}
-    completed_exercises = Column(JSON, default={})
+    # Streak of consecutive active days, maintained by app/services/activity.py
+    current_streak = Column(Integer, default=0, server_default="0", nullable=False)
+    longest_streak = Column(Integer, default=0, server_default="0", nullable=False)
+    last_active_date = Column(Date, nullable=True)
+
+    # Legacy completion blob, format: {"week1-day1-exercise0": true, ...}
+    # Moved into ExerciseCompletion by app.migrations and set to NULL afterwards
+    completed_exercises = Column(JSON, nullable=True)
 
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Indexed so the leaderboard rank index can catch up on recent writes
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     # Relationship
     user = relationship("User", back_populates="progress")
 
+# Leaderboard order; lets top-K and rank counts run as index range scans
+Index(
+    "ix_user_progress_rank",
+    UserProgress.level.desc(),
+    UserProgress.current_exp.desc(),
+    UserProgress.user_id
+)
+
+class ExerciseCompletion(Base):
+    __tablename__ = "exercise_completions"
+    __table_args__ = (
+        Index("ix_exercise_completions_user_slot", "user_id", "week", "day", "exercise_index", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    # One row per checked exercise ("week{week}-day{day}-exercise{exercise_index}")
+    week = Column(Integer, nullable=False)
+    day = Column(Integer, nullable=False)
+    exercise_index = Column(Integer, nullable=False)
+
+    # EXP granted for this completion, taken back if it is unchecked
+    exp_earned = Column(Integer, default=0, nullable=False)
+
+    completed_at = Column(DateTime, default=datetime.utcnow)
+
+class DailyActivity(Base):
+    __tablename__ = "daily_activity"
+
+    # One rollup row per user per (UTC) day with any completions
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+
+    exercises_completed = Column(Integer, default=0, nullable=False)
+    exp_earned = Column(Integer, default=0, nullable=False)
+
+class PeriodExp(Base):
+    __tablename__ = "period_exp"
+
+    # EXP earned per user per leaderboard period
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    period = Column(String, primary_key=True)  # week, month
+    period_start = Column(Date, primary_key=True)  # Monday of the week / first of the month
+
+    exp_earned = Column(Integer, default=0, nullable=False)
+
+# Weekly / monthly leaderboard order within one period
+Index(
+    "ix_period_exp_rank",
+    PeriodExp.period,
+    PeriodExp.period_start,
+    PeriodExp.exp_earned.desc(),
+    PeriodExp.user_id
+)
+
+class ProgressEvent(Base):
+    __tablename__ = "progress_events"
+    __table_args__ = (
+        Index("ix_progress_events_user_seq", "user_id", "id"),
+        Index("ix_progress_events_user_key", "user_id", "idempotency_key", unique=True),
+    )
+
+    # Server sequence number; clients sync with the last id they have seen as their cursor
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    # Client-generated key for offline events, so a replayed batch is applied once
+    idempotency_key = Column(String, nullable=True)
+
+    action = Column(String, nullable=False)  # complete, uncomplete
+    week = Column(Integer, nullable=False)
+    day = Column(Integer, nullable=False)
+    exercise_index = Column(Integer, nullable=False)
+    exp_delta = Column(Integer, default=0, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class PlanContent(Base):
+    __tablename__ = "plan_contents"
+
+    # sha256 of the canonical JSON; identical plans are stored once
+    content_hash = Column(String(64), primary_key=True)
+
+    # Exactly one of these is set (see app.services.plan_history):
+    # packed - zstd/msgpack frames from app.services.plan_codec (the default)
+    # plan_data - JSONB on Postgres with PLAN_STORAGE=jsonb
+    packed = Column(LargeBinary, nullable=True)
+    plan_data = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class WorkoutPlanVersion(Base):
+    __tablename__ = "workout_plan_versions"
+    __table_args__ = (
+        Index("ix_workout_plan_versions_user_created", "user_id", "created_at"),
+    )
+
+    # Append-only: every save that changes the plan adds a version
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    content_hash = Column(String(64), ForeignKey("plan_contents.content_hash"), nullable=False)
+    week_number = Column(Integer, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Relationships
+    user = relationship("User", back_populates="workouts")
+    content = relationship("PlanContent")
+
 class WorkoutPlan(Base):
+    # Legacy one-row-per-user plans, moved into workout_plan_versions by app.migrations
     __tablename__ = "workout_plans"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -57,5 +181,27 @@ class WorkoutPlan(Base):
 
     created_at = Column(DateTime, default=datetime.utcnow)
 
-    # Relationship
-    user = relationship("User", back_populates="workouts")
+class GeneratedPlan(Base):
+    __tablename__ = "generated_plans"
+
+    # WorkoutPlan.id (uuid4) returned by /generate-workout
+    id = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+
+    # The full generated plan (app.models.workout.WorkoutPlan as JSON)
+    plan = Column(JSON, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class PlanCacheEntry(Base):
+    __tablename__ = "plan_cache_entries"
+
+    # sha256 of the normalized UserProfile (app.services.plan_cache.profile_key)
+    profile_key = Column(String, primary_key=True)
+    # sha256 of the variant's content, so the same plan is cached once per profile
+    variant = Column(String, primary_key=True)
+
+    # AI-generated plan without id, user_profile and generated_date
+    plan = Column(JSON, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
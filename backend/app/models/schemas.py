@@ -1,6 +1,7 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field
+from typing import List, Literal, Optional
+from datetime import date, datetime
+from app.models.workout import ExerciseType
 
 # Auth Schemas
 class UserCreate(BaseModel):
@@ -29,6 +30,7 @@ class UserResponse(BaseModel):
     height: Optional[float] = None
     fitness_level: Optional[str] = None
     created_at: datetime
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -60,3 +62,70 @@ class ProgressUpdate(BaseModel):
     current_week: Optional[int] = None
     total_days: Optional[int] = None
     completed_exercises: Optional[dict] = None
+
+class ExerciseSlot(BaseModel):
+    week: int = Field(ge=0)
+    day: int = Field(ge=0)
+    exercise_index: int = Field(ge=0)
+
+class ExerciseCompletionRequest(ExerciseSlot):
+    # EXP is computed server-side from these, see app/services/progression.py
+    type: ExerciseType
+    sets: Optional[int] = Field(default=None, ge=0, le=20)
+
+class ProgressDelta(BaseModel):
+    """Result of toggling one exercise; only fields that changed are set"""
+    exercise: str
+    completed: bool
+    level: Optional[int] = None
+    current_exp: Optional[int] = None
+    exp_to_next_level: Optional[int] = None
+    total_exercises_completed: Optional[int] = None
+
+class SyncEvent(ExerciseSlot):
+    idempotency_key: str = Field(min_length=1, max_length=64)
+    action: Literal["complete", "uncomplete"]
+    type: Optional[ExerciseType] = None
+    sets: Optional[int] = Field(default=None, ge=0, le=20)
+    # When it happened on the client; completions are booked on its UTC day (clamped server-side)
+    occurred_at: Optional[datetime] = None
+
+class ProgressSyncRequest(BaseModel):
+    cursor: int = Field(default=0, ge=0)
+    events: List[SyncEvent] = Field(default_factory=list, max_length=500)
+
+class ProgressChange(BaseModel):
+    seq: int
+    action: str
+    exercise: str
+    exp_delta: int
+
+class ProgressSyncResponse(BaseModel):
+    cursor: int
+    has_more: bool
+    applied: List[str]
+    duplicates: List[str]
+    changes: List[ProgressChange]
+    level: int
+    current_exp: int
+    exp_to_next_level: int
+    total_exercises_completed: int
+
+class DailyActivityEntry(BaseModel):
+    day: date
+    exercises_completed: int
+    exp_earned: int
+
+    class Config:
+        from_attributes = True
+
+class ProgressHistoryResponse(BaseModel):
+    start: date
+    end: date
+    days: List[DailyActivityEntry]
+    exercises_completed: int
+    exp_earned: int
+    active_days: int
+    current_streak: int
+    longest_streak: int
+    last_active_date: Optional[date] = None
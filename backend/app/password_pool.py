@@ -0,0 +1,67 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class PoolSaturatedError(Exception):
+    """Raised when the password pool already has its maximum amount of queued work"""
+
+
+class PasswordHashPool:
+    """Bounded worker pool for CPU-heavy password hashing
+
+    bcrypt releases the GIL, so a thread pool already spreads hashing across cores;
+    kind="process" is available for hashers that do not. At most `workers` jobs run
+    at once and at most `max_queue` more may wait. Anything beyond that is rejected
+    immediately with PoolSaturatedError instead of piling up behind the backlog.
+    """
+
+    def __init__(self, workers: int, max_queue: int, kind: str = "thread"):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown password pool kind: {kind}")
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.kind = kind
+        self._executor: Optional[Executor] = None
+        #Only touched from the event loop thread, so no lock is needed
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run fn(*args) on the pool, or raise PoolSaturatedError if the queue is full"""
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise PoolSaturatedError(f"{self.pending} password jobs already pending")
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._get_executor(), fn, *args)
+            self.completed += 1
+            return result
+        finally:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
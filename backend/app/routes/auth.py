@@ -1,25 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from datetime import timedelta
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
 
 from app.database import get_db
 from app.models.db_models import User, UserProgress
 from app.models.schemas import UserCreate, UserLogin, Token, UserResponse, UserUpdate
+from app.services.progress_hooks import progress_written
+from app.etag import make_etag, conditional, check_if_match, claim_row
 from app.auth import (
-    get_password_hash,
+    get_password_hash_async,
     authenticate_user,
     create_access_token,
     ACCESS_TOKEN_EXPIRE_MINUTES,
-    get_current_user
+    get_current_user,
+    invalidate_cached_user
 )
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def signup(user_data: UserCreate, db: Session = Depends(get_db)):
+async def signup(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     """Register a new user"""
     #Check if email already exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == user_data.email))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -27,7 +31,7 @@ def signup(user_data: UserCreate, db: Session = Depends(get_db)):
         )
 
     #Check if username already exists
-    existing_username = db.query(User).filter(User.username == user_data.username).first()
+    existing_username = await db.scalar(select(User).where(User.username == user_data.username))
     if existing_username:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -35,7 +39,7 @@ def signup(user_data: UserCreate, db: Session = Depends(get_db)):
         )
 
     #Create new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     new_user = User(
         email=user_data.email,
         username=user_data.username,
@@ -47,8 +51,8 @@ def signup(user_data: UserCreate, db: Session = Depends(get_db)):
     )
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     #Create initial user progress
     user_progress = UserProgress(
@@ -58,19 +62,19 @@ def signup(user_data: UserCreate, db: Session = Depends(get_db)):
         exp_to_next_level=100,
         total_exercises_completed=0,
         current_week=0,
-        total_days=0,
-        completed_exercises={}
+        total_days=0
     )
 
     db.add(user_progress)
-    db.commit()
+    await db.commit()
+    progress_written(new_user.id, {"level": 1, "current_exp": 0, "total_exercises_completed": 0}, new_user.username)
 
     return new_user
 
 @router.post("/login", response_model=Token)
-def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
+async def login(user_credentials: UserLogin, db: AsyncSession = Depends(get_db)):
     """Login and get access token"""
-    user = authenticate_user(db, user_credentials.email, user_credentials.password)
+    user = await authenticate_user(db, user_credentials.email, user_credentials.password)
 
     if not user:
         raise HTTPException(
@@ -86,24 +90,56 @@ def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
 
     return {"access_token": access_token, "token_type": "bearer"}
 
+def user_etag(user) -> str:
+    return make_etag("user", user.id, user.updated_at)
+
 @router.get("/me", response_model=UserResponse)
-def get_current_user_info(current_user: User = Depends(get_current_user)):
-    """Get current user information"""
+async def get_current_user_info(
+    request: Request,
+    response: Response,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get current user information (304 when If-None-Match matches)
+
+    The ETag comes from users.updated_at, not the cached principal, so it is the tag
+    PUT /me checks If-Match against even while another worker's cache is stale.
+    """
+    updated_at = await db.scalar(select(User.updated_at).where(User.id == current_user.id))
+    not_modified = conditional(request, response, make_etag("user", current_user.id, updated_at))
+    if not_modified is not None:
+        return not_modified
+    if updated_at != current_user.updated_at:
+        #Changed through another worker since it was cached here
+        invalidate_cached_user(current_user.id)
+        return await db.get(User, current_user.id)
     return current_user
 
 @router.put("/me", response_model=UserResponse)
-def update_user_profile(
+async def update_user_profile(
     user_update: UserUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Update current user's profile information"""
+    """Update current user's profile information
+
+    With If-Match, the update only applies if the profile is unchanged since that ETag.
+    """
+    user = await db.get(User, current_user.id)
+    if check_if_match(request, user_etag(user)):
+        await claim_row(db, User, User.id == user.id, User.updated_at, user.updated_at, datetime.utcnow())
+
     #Update only provided fields
     update_data = user_update.model_dump(exclude_unset=True)
     for field, value in update_data.items():
-        setattr(current_user, field, value)
+        setattr(user, field, value)
+    user.updated_at = datetime.utcnow()
 
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(user)
+    invalidate_cached_user(user.id)
 
-    return current_user
+    response.headers["ETag"] = user_etag(user)
+    return user
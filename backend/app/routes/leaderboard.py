@@ -1,14 +1,25 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+import base64
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
 from app.database import get_db
-from app.models.db_models import User, UserProgress
+from app.models.schemas import UserResponse
 from app.auth import get_current_user
+from app.etag import make_etag, conditional
+from app.services.leaderboard import load_top, load_user_rank, load_after, load_before
+from app.services.rank_index import rank_index
+from app.services.leaderboard_snapshot import leaderboard_snapshot
+from app.services.periods import load_period_top, load_period_rank, oldest_retained, period_start
+from app.services.activity import utc_today
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/leaderboard", tags=["leaderboard"])
 
+TOP_USERS = 10
+MAX_PAGE_SIZE = 100
+MAX_RADIUS = 50
+
 class LeaderboardEntry(BaseModel):
     rank: int
     username: str
@@ -22,47 +33,214 @@ class LeaderboardEntry(BaseModel):
 class LeaderboardResponse(BaseModel):
     top_users: List[LeaderboardEntry]
     current_user_rank: LeaderboardEntry | None
+    snapshot_age_seconds: float
+
+class LeaderboardPage(BaseModel):
+    entries: List[LeaderboardEntry]
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+class PeriodLeaderboardEntry(BaseModel):
+    rank: int
+    username: str
+    exp_earned: int
+
+class PeriodLeaderboardResponse(BaseModel):
+    period: str
+    period_start: date
+    top_users: List[PeriodLeaderboardEntry]
+    current_user_rank: PeriodLeaderboardEntry | None
+
+async def _live_rank(db: AsyncSession, user_id: int):
+    """(rank, row) for one user, or None without progress
+
+    The in-memory rank index answers when it is warm. Otherwise, or when it does not
+    hold the user yet (e.g. created on another worker before catch-up), a COUNT over
+    the leaderboard index does.
+    """
+    user_rank = rank_index.rank(user_id) if rank_index.ready else None
+    if user_rank is None:
+        user_rank = await load_user_rank(db, user_id)
+    return user_rank
+
+def _entry(rank: int, row) -> LeaderboardEntry:
+    return LeaderboardEntry(
+        rank=rank,
+        username=row.username,
+        level=row.level,
+        current_exp=row.current_exp,
+        total_exercises_completed=row.total_exercises_completed
+    )
 
 @router.get("/", response_model=LeaderboardResponse)
 async def get_leaderboard(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get top 10 users by level and exp, plus current user's rank"""
-
-    #Get all users with their progress
-    all_users = db.query(
-        User.username,
-        UserProgress.level,
-        UserProgress.current_exp,
-        UserProgress.total_exercises_completed,
-        User.id
-    ).join(
-        UserProgress, User.id == UserProgress.user_id
-    ).order_by(
-        UserProgress.level.desc(),
-        UserProgress.current_exp.desc()
-    ).all()
-
-    ranked_users = []
-    current_user_entry = None
-
-    for idx, user in enumerate(all_users, start=1):
-        entry = LeaderboardEntry(
-            rank=idx,
-            username=user.username,
-            level=user.level,
-            current_exp=user.current_exp,
-            total_exercises_completed=user.total_exercises_completed
-        )
+    """Get top 10 users by level and exp, plus current user's rank
+
+    The top users come from a shared snapshot (refreshed in the background once it
+    is stale); snapshot_age_seconds says how old it is. The caller's rank is live.
+    The ETag is weak: it covers the snapshot and the caller's entry, not the age.
+    """
+    top_entries, snapshot_age = await leaderboard_snapshot.get()
 
-        if idx <= 10:
-            ranked_users.append(entry)
+    user_rank = await _live_rank(db, current_user.id)
 
-        if user.id == current_user.id:
-            current_user_entry = entry
+    if user_rank is not None:
+        rank, row = user_rank
+        caller = (rank, row.username, row.level, row.current_exp, row.total_exercises_completed)
+    else:
+        caller = None
+    not_modified = conditional(request, response, make_etag("leaderboard", leaderboard_snapshot.fingerprint, caller, weak=True))
+    if not_modified is not None:
+        return not_modified
 
     return LeaderboardResponse(
+        top_users=[_entry(rank, row) for rank, _, row in top_entries[:TOP_USERS]],
+        current_user_rank=_entry(*user_rank) if user_rank is not None else None,
+        snapshot_age_seconds=round(snapshot_age, 3)
+    )
+
+def _encode_cursor(rank: int, user_id: int, row) -> str:
+    raw = f"{row.level}:{row.current_exp}:{user_id}:{rank}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    """((level, current_exp, user_id), rank) from a cursor returned by a previous page"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        level, current_exp, user_id, rank = (int(part) for part in raw.split(":"))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    return (level, current_exp, user_id), rank
+
+def _page(entries, has_more: bool) -> LeaderboardPage:
+    """entries are (rank, user_id, row) in leaderboard order"""
+    return LeaderboardPage(
+        entries=[_entry(rank, row) for rank, _, row in entries],
+        next_cursor=_encode_cursor(*entries[-1]) if entries and has_more else None,
+        prev_cursor=_encode_cursor(*entries[0]) if entries and entries[0][0] > 1 else None
+    )
+
+def _ranked(rows, first_rank: int):
+    return [(rank, row.user_id, row) for rank, row in enumerate(rows, start=first_rank)]
+
+@router.get("/entries", response_model=LeaderboardPage)
+async def get_leaderboard_page(
+    after: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    before: Optional[str] = Query(None, description="prev_cursor of the previous page"),
+    around: Optional[Literal["me"]] = Query(None, description="Center the page on the current user"),
+    radius: int = Query(5, ge=1, le=MAX_RADIUS, description="Neighbours on each side with around=me"),
+    limit: int = Query(TOP_USERS, ge=1, le=MAX_PAGE_SIZE),
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Browse the full leaderboard with keyset cursors, or the window around the current user
+
+    Pages continue from the last row's (level, current_exp, user_id), never an OFFSET,
+    so deep pages cost the same as the first. Without the rank index, ranks on later
+    pages are carried in the cursor and can drift if users ahead move in the meantime.
+    """
+    if sum(option is not None for option in (after, before, around)) > 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use only one of after, before and around"
+        )
+
+    if around:
+        user_rank = rank_index.rank(current_user.id) if rank_index.ready else None
+        if user_rank is not None:
+            start = max(user_rank[0] - 1 - radius, 0)
+            entries = rank_index.slice(start, user_rank[0] - start + radius)
+            return _page(entries, entries[-1][0] < len(rank_index))
+        #Not in the index (cold, or the user is not caught up yet): read the window in SQL
+        user_rank = await load_user_rank(db, current_user.id)
+        if user_rank is not None:
+            rank, row = user_rank
+            key = (row.level, row.current_exp, row.user_id)
+            rows_before = await load_before(db, key, radius)
+            rows_after = await load_after(db, key, radius + 1)
+            rows = rows_before + [row] + rows_after[:radius]
+            return _page(_ranked(rows, rank - len(rows_before)), len(rows_after) > radius)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Progress not found"
+        )
+
+    if rank_index.ready:
+        if after:
+            key, _ = _decode_cursor(after)
+            start = rank_index.position(*key, inclusive=True)
+        elif before:
+            key, _ = _decode_cursor(before)
+            end = rank_index.position(*key)
+            start = max(end - limit, 0)
+            limit = end - start
+        else:
+            start = 0
+        entries = rank_index.slice(start, limit)
+        return _page(entries, start + len(entries) < len(rank_index))
+
+    if after:
+        key, rank = _decode_cursor(after)
+        rows = await load_after(db, key, limit + 1)
+        return _page(_ranked(rows[:limit], rank + 1), len(rows) > limit)
+    if before:
+        key, rank = _decode_cursor(before)
+        rows = await load_before(db, key, limit)
+        return _page(_ranked(rows, max(rank - len(rows), 1)), True)
+    rows = await load_top(db, limit + 1)
+    return _page(_ranked(rows[:limit], 1), len(rows) > limit)
+
+async def _period_leaderboard(period: str, day: Optional[date], current_user: UserResponse, db: AsyncSession) -> PeriodLeaderboardResponse:
+    today = utc_today()
+    day = day or today
+    if day > today or day < oldest_retained(period, today):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"No {period}ly leaderboard is kept for {day}"
+        )
+    start = period_start(period, day)
+
+    top_rows = await load_period_top(db, period, start, TOP_USERS)
+    ranked_users = [
+        PeriodLeaderboardEntry(rank=rank, username=row.username, exp_earned=row.exp_earned)
+        for rank, row in enumerate(top_rows, start=1)
+    ]
+    current_user_entry = next((entry for entry, row in zip(ranked_users, top_rows) if row.user_id == current_user.id), None)
+    if current_user_entry is None:
+        user_rank = await load_period_rank(db, period, start, current_user.id)
+        if user_rank is not None:
+            rank, row = user_rank
+            current_user_entry = PeriodLeaderboardEntry(rank=rank, username=row.username, exp_earned=row.exp_earned)
+
+    return PeriodLeaderboardResponse(
+        period=period,
+        period_start=start,
         top_users=ranked_users,
         current_user_rank=current_user_entry
     )
+
+@router.get("/weekly", response_model=PeriodLeaderboardResponse)
+async def get_weekly_leaderboard(
+    day: Optional[date] = Query(None, description="Any day of the week to show, defaults to today (UTC)"),
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Top 10 users by EXP earned in one week (Monday to Sunday), plus current user's rank"""
+    return await _period_leaderboard("week", day, current_user, db)
+
+@router.get("/monthly", response_model=PeriodLeaderboardResponse)
+async def get_monthly_leaderboard(
+    day: Optional[date] = Query(None, description="Any day of the month to show, defaults to today (UTC)"),
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Top 10 users by EXP earned in one calendar month, plus current user's rank"""
+    return await _period_leaderboard("month", day, current_user, db)
@@ -0,0 +1,45 @@
+import hmac
+import os
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, status
+from app.auth import password_pool, principal_cache
+from app.services.progress_buffer import progress_buffer
+from app.services.rank_index import rank_index
+from app.services.leaderboard_snapshot import leaderboard_snapshot
+from app.services.broadcaster import broadcaster
+from app.services.plan_store import plan_store
+from app.services.inference_client import inference_client
+from app.services.hedging import hedge_policy
+from app.services.model_router import model_router
+from app.services.plan_cache import plan_cache
+from app.services.single_flight import generation_flights
+
+router = APIRouter(prefix="/ops", tags=["operations"])
+
+#Shared secret for the operations endpoints; they are disabled while it is unset
+OPS_TOKEN = os.getenv("OPS_TOKEN")
+
+def _require_ops_token(token: Optional[str]) -> None:
+    if not OPS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if token is None or not hmac.compare_digest(token, OPS_TOKEN):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid operations token")
+
+@router.get("/stats")
+async def get_stats(x_ops_token: Optional[str] = Header(None)):
+    """Counters of this worker's in-process components, including AI model health"""
+    _require_ops_token(x_ops_token)
+    return {
+        "models": model_router.stats(),
+        "hedging": hedge_policy.stats(),
+        "plan_cache": plan_cache.stats(),
+        "coalescing": generation_flights.stats(),
+        "inference_client": inference_client.stats(),
+        "plan_store": plan_store.stats(),
+        "progress_buffer": progress_buffer.stats(),
+        "rank_index": rank_index.stats(),
+        "leaderboard_snapshot": leaderboard_snapshot.stats(),
+        "broadcaster": broadcaster.stats(),
+        "password_pool": password_pool.stats(),
+        "principal_cache": principal_cache.stats(),
+    }
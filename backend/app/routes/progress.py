@@ -1,20 +1,131 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from typing import Optional
+from datetime import date, datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
-from app.models.db_models import User, UserProgress
-from app.models.schemas import ProgressResponse, ProgressUpdate
+from app.models.db_models import UserProgress
+from app.models.schemas import (
+    ProgressResponse,
+    ProgressUpdate,
+    UserResponse,
+    ExerciseSlot,
+    ExerciseCompletionRequest,
+    ProgressDelta,
+    ProgressSyncRequest,
+    ProgressSyncResponse,
+    ProgressChange,
+    DailyActivityEntry,
+    ProgressHistoryResponse
+)
 from app.auth import get_current_user
+from app.services.completions import (
+    completion_key,
+    load_completed_exercises,
+    slots_from_dict,
+    record_progress_save,
+    clear_completions,
+    mark_completed,
+    unmark_completed,
+    apply_event_batch,
+    load_events_since
+)
+from app.services.progression import exp_gain, level_from_total_exp, total_exp
+from app.services.progress_buffer import progress_buffer
+from app.services.activity import current_streak, load_history, utc_today
+from app.services.progress_hooks import progress_written
+from app.etag import make_etag, conditional, check_if_match, claim_row
 
 router = APIRouter(prefix="/progress", tags=["progress"])
 
+#Maximum server events returned per sync; clients call again while has_more is set
+SYNC_PAGE_SIZE = 500
+
+#Longest date range /progress/history will return
+MAX_HISTORY_DAYS = 366
+
+PROGRESS_FIELDS = ("level", "current_exp", "exp_to_next_level", "total_exercises_completed", "current_week", "total_days")
+
+def _overlay_pending(progress: UserProgress, take: bool = False) -> Optional[dict]:
+    """Apply write-behind state that has not reached the database yet (never committed)
+
+    With take, the state is also removed from the buffer, so a flush cannot write it
+    over the caller's own write.
+    """
+    pending = progress_buffer.take(progress.user_id) if take else progress_buffer.get(progress.user_id)
+    if pending:
+        for field in PROGRESS_FIELDS:
+            if field in pending:
+                setattr(progress, field, pending[field])
+    return pending
+
+def progress_etag(progress: UserProgress, pending: Optional[dict] = None) -> str:
+    """ETag of GET /progress/: the row's updated_at plus any write-behind state not yet flushed"""
+    return make_etag(
+        "progress",
+        progress.user_id,
+        progress.updated_at,
+        json.dumps(pending, sort_keys=True, default=str) if pending else ""
+    )
+
+async def _claim_progress(request: Request, db: AsyncSession, progress: UserProgress, pending: Optional[dict]) -> None:
+    """Honour If-Match on a progress write (412 when the client's copy is stale)
+
+    pending must already be taken from the buffer (see _overlay_pending), so that
+    the checked state cannot be flushed while the row is claimed.
+    """
+    if check_if_match(request, progress_etag(progress, pending)):
+        await claim_row(
+            db, UserProgress, UserProgress.user_id == progress.user_id,
+            UserProgress.updated_at, progress.updated_at, datetime.utcnow()
+        )
+
+async def _progress_response(db: AsyncSession, progress: UserProgress, pending: Optional[dict] = None) -> ProgressResponse:
+    """Combine the progress row with completions from the exercise_completions table"""
+    if pending and "completed_exercises" in pending:
+        completed_exercises = {completion_key(*slot): True for slot in sorted(slots_from_dict(pending["completed_exercises"]))}
+    else:
+        completed_exercises = await load_completed_exercises(db, progress.user_id)
+
+    return ProgressResponse(
+        level=progress.level,
+        current_exp=progress.current_exp,
+        exp_to_next_level=progress.exp_to_next_level,
+        total_exercises_completed=progress.total_exercises_completed,
+        current_week=progress.current_week,
+        total_days=progress.total_days,
+        completed_exercises=completed_exercises
+    )
+
+async def _finish_delta(db: AsyncSession, user_id: int, slot, changed, completed: bool) -> ProgressDelta:
+    """Commit a single-exercise toggle and build its delta response"""
+    if changed is None:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Progress not found"
+        )
+
+    await db.commit()
+    delta = ProgressDelta(exercise=completion_key(*slot), completed=completed, **changed)
+    progress_written(user_id, delta.model_dump(exclude_unset=True))
+    return delta
+
 @router.get("/", response_model=ProgressResponse)
-def get_user_progress(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def get_user_progress(
+    request: Request,
+    response: Response,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get current user's progress"""
-    progress = db.query(UserProgress).filter(UserProgress.user_id == current_user.id).first()
+    """Get current user's progress
+
+    Answers If-None-Match with 304 before the completions are loaded.
+    """
+    progress = await db.scalar(select(UserProgress).where(UserProgress.user_id == current_user.id))
 
     if not progress:
         #Create initial progress if doesn't exist
@@ -25,23 +136,33 @@ def get_user_progress(
             exp_to_next_level=100,
             total_exercises_completed=0,
             current_week=0,
-            total_days=0,
-            completed_exercises={}
+            total_days=0
         )
         db.add(progress)
-        db.commit()
-        db.refresh(progress)
+        await db.commit()
+        await db.refresh(progress)
+        progress_written(current_user.id, {field: getattr(progress, field) for field in PROGRESS_FIELDS}, current_user.username)
 
-    return progress
+    pending = _overlay_pending(progress)
+    not_modified = conditional(request, response, progress_etag(progress, pending))
+    if not_modified is not None:
+        return not_modified
+    return await _progress_response(db, progress, pending)
 
 @router.put("/", response_model=ProgressResponse)
-def update_user_progress(
+async def update_user_progress(
     progress_update: ProgressUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Update user's progress"""
-    progress = db.query(UserProgress).filter(UserProgress.user_id == current_user.id).first()
+    """Update user's progress
+
+    With If-Match, the update only applies if progress is unchanged since that ETag.
+    Such updates bypass the write-behind buffer, taking its pending state with them.
+    """
+    progress = await db.scalar(select(UserProgress).where(UserProgress.user_id == current_user.id))
 
     if not progress:
         raise HTTPException(
@@ -49,23 +170,190 @@ def update_user_progress(
             detail="Progress not found"
         )
 
+    stored_exp = total_exp(progress.level, progress.current_exp)
+    write_through = not progress_buffer.enabled or "if-match" in request.headers
+    pending = _overlay_pending(progress, take=write_through)
+    try:
+        await _claim_progress(request, db, progress, pending)
+    except HTTPException:
+        progress_buffer.restore(current_user.id, pending)
+        raise
+
     #Update only provided fields
     update_data = progress_update.model_dump(exclude_unset=True)
+    completed_exercises = update_data.pop("completed_exercises", (pending or {}).get("completed_exercises"))
     for field, value in update_data.items():
         setattr(progress, field, value)
 
-    db.commit()
-    db.refresh(progress)
+    #Keep level and EXP consistent with the server's progression rules
+    progress.level, progress.current_exp, progress.exp_to_next_level = level_from_total_exp(
+        total_exp(progress.level, progress.current_exp)
+    )
+
+    if not write_through:
+        #Coalesced in memory and written by the next batched flush; nothing is committed here
+        changes = {field: getattr(progress, field) for field in PROGRESS_FIELDS}
+        if completed_exercises is not None:
+            changes["completed_exercises"] = completed_exercises
+        progress_buffer.put(current_user.id, changes)
+        pending = progress_buffer.get(current_user.id)
+        response.headers["ETag"] = progress_etag(progress, pending)
+        return await _progress_response(db, progress, pending)
+
+    #Only the exercises that were checked or unchecked since last time are written, and
+    #the EXP gained goes into today's activity and the weekly / monthly boards
+    try:
+        await record_progress_save(
+            db, current_user.id, completed_exercises,
+            total_exp(progress.level, progress.current_exp) - stored_exp
+        )
+
+        #Completions live in their own table, so move the validator even if no field changed
+        progress.updated_at = datetime.utcnow()
+        await db.commit()
+    except Exception:
+        progress_buffer.restore(current_user.id, pending)
+        raise
+    await db.refresh(progress)
+    progress_written(current_user.id, {field: getattr(progress, field) for field in PROGRESS_FIELDS})
+
+    response.headers["ETag"] = progress_etag(progress)
+    return await _progress_response(db, progress)
+
+@router.post("/complete", response_model=ProgressDelta, response_model_exclude_unset=True)
+async def complete_exercise(
+    completion: ExerciseCompletionRequest,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Mark one exercise as completed and return only the progress fields that changed"""
+    slot = (completion.week, completion.day, completion.exercise_index)
+    await progress_buffer.flush([current_user.id])
+    changed = await mark_completed(db, current_user.id, slot, exp_gain(completion.type, completion.sets))
+    return await _finish_delta(db, current_user.id, slot, changed, completed=True)
+
+@router.delete("/complete", response_model=ProgressDelta, response_model_exclude_unset=True)
+async def uncomplete_exercise(
+    completion: ExerciseSlot,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Un-check one exercise, taking back the EXP it earned"""
+    slot = (completion.week, completion.day, completion.exercise_index)
+    await progress_buffer.flush([current_user.id])
+    changed = await unmark_completed(db, current_user.id, slot)
+    return await _finish_delta(db, current_user.id, slot, changed, completed=False)
+
+@router.get("/history", response_model=ProgressHistoryResponse)
+async def get_progress_history(
+    start: Optional[date] = Query(None, description="First day (UTC), defaults to 29 days before end"),
+    end: Optional[date] = Query(None, description="Last day (UTC), defaults to today"),
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Daily activity rollups for a date range plus the current streak"""
+    end = end or utc_today()
+    start = start or end - timedelta(days=29)
+    if start > end or (end - start).days >= MAX_HISTORY_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Date range must be between 1 and {MAX_HISTORY_DAYS} days"
+        )
+
+    progress = await db.scalar(select(UserProgress).where(UserProgress.user_id == current_user.id))
+    if not progress:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Progress not found"
+        )
+
+    days = [DailyActivityEntry.model_validate(row) for row in await load_history(db, current_user.id, start, end)]
+
+    return ProgressHistoryResponse(
+        start=start,
+        end=end,
+        days=days,
+        exercises_completed=sum(entry.exercises_completed for entry in days),
+        exp_earned=sum(entry.exp_earned for entry in days),
+        active_days=sum(1 for entry in days if entry.exercises_completed > 0),
+        current_streak=current_streak(progress),
+        longest_streak=progress.longest_streak or 0,
+        last_active_date=progress.last_active_date
+    )
+
+@router.post("/sync", response_model=ProgressSyncResponse)
+async def sync_progress(
+    sync: ProgressSyncRequest,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Apply a batch of offline completion events and return changes after the client's cursor
+
+    Events are applied in order in a single transaction. Each carries a client
+    idempotency key, so resending a batch after a dropped response is safe.
+    """
+    await progress_buffer.flush([current_user.id])
+    try:
+        applied, duplicates, changed = await apply_event_batch(db, current_user.id, sync.events)
+    except IntegrityError:
+        #Another request applied some of these keys at the same moment
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Concurrent sync in progress, please retry"
+        )
+    if changed is None:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Progress not found"
+        )
+    await db.commit()
+
+    events = await load_events_since(db, current_user.id, sync.cursor, SYNC_PAGE_SIZE + 1)
+    has_more = len(events) > SYNC_PAGE_SIZE
+    events = events[:SYNC_PAGE_SIZE]
+    progress = await db.scalar(select(UserProgress).where(UserProgress.user_id == current_user.id))
+    progress_written(current_user.id, {field: getattr(progress, field) for field in PROGRESS_FIELDS})
 
-    return progress
+    return ProgressSyncResponse(
+        cursor=events[-1].id if events else sync.cursor,
+        has_more=has_more,
+        applied=applied,
+        duplicates=duplicates,
+        changes=[
+            ProgressChange(
+                seq=event.id,
+                action=event.action,
+                exercise=completion_key(event.week, event.day, event.exercise_index),
+                exp_delta=event.exp_delta
+            )
+            for event in events
+        ],
+        level=progress.level,
+        current_exp=progress.current_exp,
+        exp_to_next_level=progress.exp_to_next_level,
+        total_exercises_completed=progress.total_exercises_completed
+    )
 
 @router.delete("/")
-def reset_user_progress(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def reset_user_progress(
+    request: Request,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Reset user's progress to initial state"""
-    progress = db.query(UserProgress).filter(UserProgress.user_id == current_user.id).first()
+    """Reset user's progress to initial state (honours If-Match like PUT)"""
+    progress = await db.scalar(select(UserProgress).where(UserProgress.user_id == current_user.id))
+    #Taken before the row is claimed, so a flush cannot write it over the reset
+    pending = progress_buffer.take(current_user.id)
+    try:
+        if progress:
+            await _claim_progress(request, db, progress, pending)
+        else:
+            check_if_match(request, None)
+    except HTTPException:
+        progress_buffer.restore(current_user.id, pending)
+        raise
 
     if progress:
         progress.level = 1
@@ -74,8 +362,13 @@ def reset_user_progress(
         progress.total_exercises_completed = 0
         progress.current_week = 0
         progress.total_days = 0
-        progress.completed_exercises = {}
+        progress.current_streak = 0
+        progress.longest_streak = 0
+        progress.last_active_date = None
+        progress.updated_at = datetime.utcnow()
+        await clear_completions(db, current_user.id)
 
-        db.commit()
+        await db.commit()
+        progress_written(current_user.id, {field: getattr(progress, field) for field in PROGRESS_FIELDS})
 
     return {"message": "Progress reset successfully"}
@@ -0,0 +1,61 @@
+import asyncio
+import os
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from app.models.schemas import UserResponse
+from app.auth import STREAM_TOKEN_EXPIRE_SECONDS, create_stream_token, get_current_user, get_stream_user
+from app.services.broadcaster import broadcaster, format_sse
+from app.services.rank_index import rank_index
+
+router = APIRouter(prefix="/stream", tags=["stream"])
+
+#Idle streams get a comment line this often, so proxies keep them open and dead clients are noticed
+HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+
+class StreamToken(BaseModel):
+    token: str
+    expires_in: int
+
+@router.post("/token", response_model=StreamToken)
+async def create_stream_ticket(current_user: UserResponse = Depends(get_current_user)):
+    """Short-lived token for opening the stream with EventSource: GET /stream/?token=..."""
+    return StreamToken(token=create_stream_token(current_user.id), expires_in=STREAM_TOKEN_EXPIRE_SECONDS)
+
+@router.get("/")
+async def stream_updates(current_user: UserResponse = Depends(get_stream_user)):
+    """Server-Sent Events: this user's progress deltas, their rank and top-10 changes
+
+    Authenticate with an Authorization: Bearer header (fetch-based readers) or, from a
+    browser EventSource, with ?token= from POST /stream/token. The token is only
+    checked when the stream opens. If EventSource reconnects after it expired, the
+    connection is refused and the client should fetch a new one.
+
+    Events: "progress" (changed progress fields), "rank" ({"rank": n}),
+    "leaderboard" ({"top_users": [...]}) and "resync" (the client fell behind and
+    should re-fetch /progress/ and /leaderboard/).
+    """
+    subscription = broadcaster.subscribe(current_user.id)
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            user_rank = rank_index.rank(current_user.id) if rank_index.ready else None
+            if user_rank is not None:
+                subscription.last_rank = user_rank[0]
+                yield format_sse("rank", {"rank": user_rank[0]})
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(subscription.queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(event, data)
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
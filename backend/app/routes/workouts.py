@@ -1,13 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from datetime import datetime
 from app.database import get_db
-from app.models.db_models import WorkoutPlan, User
+from app.etag import make_etag, conditional, check_if_match, claim_row
+from app.models.db_models import User
+from app.models.schemas import UserResponse
 from app.auth import get_current_user
+from app.services.plan_history import save_version, load_current, load_current_id, load_current_day, clear_current, load_history
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/workouts", tags=["workouts"])
 
+MAX_HISTORY = 100
+
+def workout_etag(version_id: Optional[int], *parts) -> Optional[str]:
+    """Versions are immutable, so the id of the current one is the whole validator"""
+    return make_etag("workout", version_id, *parts) if version_id is not None else None
+
+async def _claim_current(request: Request, db: AsyncSession, user_id: int) -> None:
+    """Honour If-Match on a change of the current plan (412 when it moved meanwhile)"""
+    if "if-match" not in request.headers:
+        return
+    current_id = await load_current_id(db, user_id)
+    if check_if_match(request, workout_etag(current_id)):
+        await claim_row(db, User, User.id == user_id, User.current_workout_id, current_id)
+
 class WorkoutCreate(BaseModel):
     plan_data: dict
     week_number: int
@@ -20,48 +38,111 @@ class WorkoutResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class WorkoutDayResponse(BaseModel):
+    id: int
+    week_number: int
+    day: dict
+
+class WorkoutVersion(BaseModel):
+    id: int
+    week_number: int
+    content_hash: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
 @router.post("/", response_model=WorkoutResponse, status_code=status.HTTP_201_CREATED)
 async def save_workout(
     workout: WorkoutCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Save or update the user's current workout plan"""
-    #Delete any existing current workout for this user
-    db.query(WorkoutPlan).filter(WorkoutPlan.user_id == current_user.id).delete()
-
-    #Create new workout
-    new_workout = WorkoutPlan(
-        user_id=current_user.id,
-        plan_data=workout.plan_data,
-        week_number=workout.week_number
-    )
+    """Save the user's current workout plan as a new version
 
-    db.add(new_workout)
-    db.commit()
-    db.refresh(new_workout)
+    Re-saving the plan that is already current writes nothing and returns 200. With
+    If-Match, the save only applies if the current plan is still the one in that ETag.
+    """
+    await _claim_current(request, db, current_user.id)
+    version, created = await save_version(db, current_user.id, workout.plan_data, workout.week_number)
+    if created:
+        await db.commit()
+    else:
+        response.status_code = status.HTTP_200_OK
 
-    return new_workout
+    response.headers["ETag"] = workout_etag(version.id)
+    return WorkoutResponse(id=version.id, plan_data=workout.plan_data, week_number=version.week_number)
 
 @router.get("/current", response_model=Optional[WorkoutResponse])
 async def get_current_workout(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the user's current workout plan
+
+    If-None-Match is answered from the user's pointer alone; the plan is only loaded
+    and decoded when it changed.
+    """
+    current_id = await load_current_id(db, current_user.id)
+    not_modified = conditional(request, response, workout_etag(current_id))
+    if not_modified is not None:
+        return not_modified
+
+    current = await load_current(db, current_user.id)
+    if current is None:
+        return None
+
+    version, plan_data = current
+    response.headers["ETag"] = workout_etag(version.id)
+    return WorkoutResponse(id=version.id, plan_data=plan_data, week_number=version.week_number)
+
+@router.get("/current/days/{day}", response_model=WorkoutDayResponse)
+async def get_current_workout_day(
+    day: int,
+    request: Request,
+    response: Response,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get the user's current workout plan"""
-    workout = db.query(WorkoutPlan).filter(
-        WorkoutPlan.user_id == current_user.id
-    ).order_by(WorkoutPlan.created_at.desc()).first()
+    """Get one day of the user's current plan (weekly_schedule entry with this "day")"""
+    current_id = await load_current_id(db, current_user.id)
+    not_modified = conditional(request, response, workout_etag(current_id, "day", day))
+    if not_modified is not None:
+        return not_modified
+
+    current = await load_current_day(db, current_user.id, day)
+    if current is None or current[1] is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Workout day not found"
+        )
 
-    return workout
+    version, day_data = current
+    response.headers["ETag"] = workout_etag(version.id, "day", day)
+    return WorkoutDayResponse(id=version.id, week_number=version.week_number, day=day_data)
+
+@router.get("/history", response_model=List[WorkoutVersion])
+async def get_workout_history(
+    limit: int = Query(20, ge=1, le=MAX_HISTORY),
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """The user's saved plan versions, newest first"""
+    return await load_history(db, current_user.id, limit)
 
 @router.delete("/current", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_current_workout(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Delete the user's current workout plan"""
-    db.query(WorkoutPlan).filter(WorkoutPlan.user_id == current_user.id).delete()
-    db.commit()
+    """Clear the user's current workout plan (its versions stay in the history); honours If-Match"""
+    await _claim_current(request, db, current_user.id)
+    await clear_current(db, current_user.id)
+    await db.commit()
 
     return None
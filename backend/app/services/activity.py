@@ -0,0 +1,141 @@
+"""
+Daily activity rollups and streaks
+
+Every completion adjusts one daily_activity row, the weekly / monthly EXP totals
+(app.services.periods) and, on the first completion of a day, the streak columns
+on user_progress. Reads never touch raw completion history:
+a date range is an index seek on (user_id, day), and the current streak is read
+straight off the progress row.
+"""
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import select, update, insert, case, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.db_models import DailyActivity, UserProgress
+from app.services.periods import add_period_exp
+
+
+def utc_today() -> date:
+    return datetime.utcnow().date()
+
+
+async def record_activity(
+    db: AsyncSession,
+    user_id: int,
+    exercise_delta: int,
+    exp_delta: int,
+    day: Optional[date] = None,
+    active: Optional[bool] = None
+) -> None:
+    """Add completions / EXP to the user's rollup for `day` (today by default)
+
+    `active` marks the day for the streak; it defaults to "something was completed".
+    """
+    if active is None:
+        active = exercise_delta > 0
+    day = day or utc_today()
+    extended = active and await _extend_streak(db, user_id, day)
+    if exercise_delta or exp_delta:
+        await add_period_exp(db, user_id, day, exp_delta)
+        await _add_to_rollup(db, user_id, day, exercise_delta, exp_delta)
+    if active and not extended and day < utc_today():
+        #A day before the last active one, e.g. from an offline sync
+        await _backfill_streak(db, user_id, day)
+
+
+async def _add_to_rollup(db: AsyncSession, user_id: int, day: date, exercise_delta: int, exp_delta: int) -> None:
+    values = {
+        "exercises_completed": DailyActivity.exercises_completed + exercise_delta,
+        "exp_earned": DailyActivity.exp_earned + exp_delta
+    }
+    where = (DailyActivity.user_id == user_id, DailyActivity.day == day)
+    result = await db.execute(update(DailyActivity).where(*where).values(**values))
+    if result.rowcount == 0:
+        try:
+            async with db.begin_nested():
+                await db.execute(insert(DailyActivity).values(
+                    user_id=user_id, day=day, exercises_completed=exercise_delta, exp_earned=exp_delta
+                ))
+        except IntegrityError:
+            #Another request created the day's row first
+            await db.execute(update(DailyActivity).where(*where).values(**values))
+
+
+async def _extend_streak(db: AsyncSession, user_id: int, day: date) -> bool:
+    """Count `day` as active; False (a no-op) unless it is after the last active day"""
+    new_streak = case(
+        (UserProgress.last_active_date == day - timedelta(days=1), UserProgress.current_streak + 1),
+        else_=1
+    )
+    result = await db.execute(
+        update(UserProgress)
+        .where(
+            UserProgress.user_id == user_id,
+            or_(UserProgress.last_active_date.is_(None), UserProgress.last_active_date < day)
+        )
+        .values(
+            current_streak=new_streak,
+            longest_streak=case((new_streak > UserProgress.longest_streak, new_streak), else_=UserProgress.longest_streak),
+            last_active_date=day
+        )
+    )
+    return result.rowcount > 0
+
+
+async def _backfill_streak(db: AsyncSession, user_id: int, day: date) -> None:
+    """Lengthen the streak when `day` is just before it, joining any run of active days before that"""
+    progress = (await db.execute(
+        select(UserProgress.current_streak, UserProgress.last_active_date)
+        .where(UserProgress.user_id == user_id)
+    )).one_or_none()
+    if progress is None or progress.last_active_date is None:
+        return
+    if day != progress.last_active_date - timedelta(days=progress.current_streak or 0):
+        return
+
+    joined = 0
+    expected = day
+    result = await db.stream_scalars(
+        select(DailyActivity.day)
+        .where(DailyActivity.user_id == user_id, DailyActivity.day <= day, DailyActivity.exercises_completed > 0)
+        .order_by(DailyActivity.day.desc())
+    )
+    async for active_day in result:
+        if active_day != expected:
+            break
+        joined += 1
+        expected -= timedelta(days=1)
+    await result.close()
+    if not joined:
+        return
+
+    new_streak = UserProgress.current_streak + joined
+    await db.execute(
+        update(UserProgress)
+        .where(UserProgress.user_id == user_id)
+        .values(
+            current_streak=new_streak,
+            longest_streak=case((new_streak > UserProgress.longest_streak, new_streak), else_=UserProgress.longest_streak)
+        )
+    )
+
+
+def current_streak(progress: UserProgress, today: Optional[date] = None) -> int:
+    """Streak as of today: it survives until a full day passes with no activity"""
+    today = today or utc_today()
+    if progress.last_active_date is None or progress.last_active_date < today - timedelta(days=1):
+        return 0
+    return progress.current_streak or 0
+
+
+async def load_history(db: AsyncSession, user_id: int, start: date, end: date) -> List[DailyActivity]:
+    """Rollup rows for start..end inclusive, oldest first (days without activity are absent)"""
+    result = await db.scalars(
+        select(DailyActivity)
+        .where(DailyActivity.user_id == user_id, DailyActivity.day >= start, DailyActivity.day <= end)
+        .order_by(DailyActivity.day)
+    )
+    return list(result)
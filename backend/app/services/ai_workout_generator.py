@@ -1,7 +1,10 @@
 import os
 import json
-import requests
-from typing import Dict, Any
+import asyncio
+import functools
+import time
+import httpx
+from typing import Dict, Any, Optional
 from datetime import date
 import uuid
 from dotenv import load_dotenv
@@ -13,13 +16,21 @@ from app.models.user import UserProfile
 from app.models.workout import WorkoutPlan, WorkoutDay, WorkoutWeek, Exercise, ExerciseType
 from app.services.workout_library import EXERCISE_LIBRARY
 from app.services.fallback_workout_generator import FallbackWorkoutGenerator
+from app.services.inference_client import inference_client
+from app.services.hedging import hedge_policy
+from app.services.model_router import model_router
+from app.services.plan_cache import plan_cache, profile_key
+from app.services.single_flight import generation_flights
+
+#Upper bound for one generation across all models before the fallback plan is used
+GENERATION_TIMEOUT_SECONDS = float(os.getenv("HF_GENERATION_TIMEOUT_SECONDS", "90"))
 
 
 class HuggingFaceWorkoutGenerator:
     def __init__(self):
         self.fallback_generator = FallbackWorkoutGenerator()
-        #Use the correct Chat Completions API endpoint
-        self.api_url = "https://router.huggingface.co/v1/chat/completions"
+        #Requests go through the shared connection pool in app.services.inference_client
+        self.client = inference_client
         self.api_token = os.getenv("HUGGINGFACE_API_TOKEN")
 
         #List of models to try in order
@@ -31,85 +42,150 @@ class HuggingFaceWorkoutGenerator:
         ]
 
         if self.api_token:
-            self.headers = {
-                "Authorization": f"Bearer {self.api_token}",
-                "Content-Type": "application/json"
-            }
             print("Hugging Face API token loaded")
             print("Using Chat Completions API")
         else:
-            self.headers = {}
             print("WARNING: Hugging Face API token not found")
     
-    def generate_workout_plan(self, user_profile: UserProfile) -> WorkoutPlan:
+    async def generate_workout_plan(self, user_profile: UserProfile) -> WorkoutPlan:
         if self.api_token:
+            #Similar profiles share plans once enough variants of them are cached
+            cached = await self._cached_plan(plan_cache.lookup, user_profile)
+            if cached is not None:
+                print("Using a cached AI workout for this profile")
+                return cached
             try:
-                print("Attempting AI workout generation...")
-                return self._generate_with_huggingface(user_profile)
+                #Concurrent requests for the same normalized profile share one generation
+                workout_plan, shared = await generation_flights.do(
+                    profile_key(user_profile), functools.partial(self._generate_and_cache, user_profile)
+                )
             except Exception as e:
                 print(f"ERROR: AI generation failed: {e}")
+                cached = await self._cached_plan(plan_cache.any_variant, user_profile)
+                if cached is not None:
+                    print("Using a cached AI workout for this profile instead")
+                    return cached
                 print("Using fallback workout generator...")
                 return self.fallback_generator.generate_workout_plan(user_profile)
+            if shared:
+                print("Using the AI workout generated for a concurrent identical profile")
+                return workout_plan.model_copy(update={"id": str(uuid.uuid4()), "user_profile": user_profile})
+            return workout_plan
         else:
             print("No API token found. Using fallback workout generator...")
             return self.fallback_generator.generate_workout_plan(user_profile)
     
-    def _generate_with_huggingface(self, user_profile: UserProfile) -> WorkoutPlan:
-        prompt = self._build_prompt(user_profile)
+    async def _cached_plan(self, read, user_profile: UserProfile) -> Optional[WorkoutPlan]:
+        """A plan from the profile cache; a cache that cannot be read counts as a miss"""
+        try:
+            return await read(user_profile)
+        except Exception as e:
+            print(f"ERROR: Could not read the AI workout cache: {e}")
+            return None
 
-        last_error = None
+    async def _generate_and_cache(self, user_profile: UserProfile) -> WorkoutPlan:
+        print("Attempting AI workout generation...")
+        async with asyncio.timeout(GENERATION_TIMEOUT_SECONDS):
+            workout_plan = await self._generate_with_huggingface(user_profile)
+        try:
+            await plan_cache.add(user_profile, workout_plan)
+        except Exception as e:
+            print(f"ERROR: Could not cache the AI workout: {e}")
+        return workout_plan
 
-        for i, model in enumerate(self.models):
-            print(f"Trying model {i+1}/{len(self.models)}: {model}")
+    async def _generate_with_huggingface(self, user_profile: UserProfile) -> WorkoutPlan:
+        prompt = self._build_prompt(user_profile)
 
-            payload = {
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "model": model,
-                "max_tokens": 1000,
-                "temperature": 0.7
-            }
+        #Healthy models, best expected latency first; hedge_policy overlaps a slow one with the next
+        models = model_router.route(self.models)
+        if not models:
+            raise Exception("All models are unavailable (circuit open)")
+        attempts = [
+            functools.partial(self._generate_with_model, i, model, prompt, user_profile)
+            for i, model in enumerate(models)
+        ]
+        try:
+            return await hedge_policy.run(attempts)
+        except Exception as e:
+            #If all models failed, raise the last error
+            print(f"All {len(models)} models failed. Using fallback workout.")
+            raise Exception(f"All models failed. Last error: {e}")
+
+    async def _generate_with_model(self, i: int, model: str, prompt: str, user_profile: UserProfile) -> WorkoutPlan:
+        """One model's attempt; raises unless it returns a plan that parses
+
+        The outcome and latency are recorded in model_router. A cancelled attempt (a
+        hedge that lost) records nothing.
+        """
+        if not model_router.begin(model):
+            raise Exception(f"Model {model} circuit open")
+        print(f"Trying model {i+1}: {model}")
+
+        payload = {
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "model": model,
+            "max_tokens": 1000,
+            "temperature": 0.7
+        }
 
+        started = time.perf_counter()
+        outcome = None
+        try:
             try:
-                response = requests.post(
-                    self.api_url,
-                    headers=self.headers,
-                    json=payload,
-                    timeout=60
-                )
-
-                print(f"Response status: {response.status_code}")
-
-                if response.status_code == 200:
-                    result = response.json()
-                    print(f"Model {model} succeeded!")
-                    workout_data = self._parse_ai_response(result, user_profile)
-                    return self._create_workout_plan(user_profile, workout_data)
-                else:
-                    error_msg = f"API error {response.status_code}: {response.text}"
-                    print(f"Model {model} failed: {error_msg}")
-                    last_error = error_msg
-                    continue
-
-            except requests.exceptions.Timeout:
-                error_msg = f"Model {model} timeout"
-                print(f"ERROR: {error_msg}")
-                last_error = error_msg
-                continue
-            except Exception as e:
-                error_msg = f"Model {model} error: {e}"
+                response = await self.client.complete(payload, self.api_token)
+            except httpx.PoolTimeout:
+                raise
+            except httpx.TimeoutException as e:
+                outcome = "timeout"
+                error_msg = f"Model {model} timeout ({type(e).__name__})"
                 print(f"ERROR: {error_msg}")
-                last_error = error_msg
-                continue
+                raise Exception(error_msg)
+
+            print(f"Response status: {response.status_code}")
+            if response.status_code != 200:
+                outcome = "error"
+                error_msg = f"API error {response.status_code}: {response.text}"
+                print(f"Model {model} failed: {error_msg}")
+                raise Exception(error_msg)
+
+            try:
+                body = response.json()
+            except ValueError as e:
+                #A 200 whose body is not JSON is the model's output problem, not a transport error
+                outcome = "parse"
+                raise Exception(f"Model {model} returned a body that is not JSON: {e}")
+            workout_data = self._parse_ai_response(body, user_profile)
+            if workout_data is None:
+                outcome = "parse"
+                raise Exception(f"Model {model} returned no usable plan")
+            try:
+                workout_plan = self._create_workout_plan(user_profile, workout_data)
+            except ValueError as e:
+                outcome = "parse"
+                raise Exception(f"Model {model} returned an invalid plan: {e}")
+
+            outcome = "ok"
+            print(f"Model {model} succeeded!")
+            return workout_plan
+        except httpx.PoolTimeout:
+            #Our own connection pool was full, which says nothing about the model
+            raise Exception(f"Model {model} not tried: connection pool exhausted")
+        except Exception as e:
+            if outcome is None:
+                outcome = "error"
+                print(f"ERROR: Model {model} error: {e}")
+            raise
+        finally:
+            if outcome is None:
+                model_router.cancel(model)
+            else:
+                model_router.record(model, outcome, time.perf_counter() - started)
 
-        #If all models failed, raise the last error
-        print(f"All {len(self.models)} models failed. Using fallback workout.")
-        raise Exception(f"All models failed. Last error: {last_error}")
-    
     def _build_prompt(self, profile: UserProfile) -> str:
         #Build the available exercises list from the library
         available_exercises = "\n\nAVAILABLE EXERCISES (You MUST only choose from these):\n"
@@ -178,8 +254,8 @@ Generate all {profile.days_per_week} days with different focuses and exercises f
 
 CRITICAL: Return ONLY valid JSON on a single line with NO newlines, NO formatting, NO other text. Example format: {{"weekly_schedule":[{{"day":1,"focus":"Upper Body","exercises":[{{"name":"Push-ups","type":"strength","sets":3,"reps":12,"rest":60}}],"total_duration":40}}]}}"""
     
-    def _parse_ai_response(self, response_data: Dict, user_profile: UserProfile) -> Dict[str, Any]:
-        """Parse the Chat Completions API response"""
+    def _parse_ai_response(self, response_data: Dict, user_profile: UserProfile) -> Optional[Dict[str, Any]]:
+        """Parse the Chat Completions API response (None if it holds no usable plan)"""
         print(f"Parsing response...")
 
         try:
@@ -192,13 +268,13 @@ CRITICAL: Return ONLY valid JSON on a single line with NO newlines, NO formattin
             if workout_data:
                 return workout_data
             else:
-                #If JSON extraction fails, return default workout data
-                print("JSON extraction failed, using default workout data")
-                return self._get_default_workout_data()
+                #If JSON extraction fails, the next model gets a chance
+                print("JSON extraction failed")
+                return None
 
         except Exception as e:
             print(f"ERROR: Error parsing AI response: {e}")
-            return self._get_default_workout_data()
+            return None
     
     def _extract_json_from_text(self, text: str) -> Dict[str, Any]:
         """Extract JSON from text response"""
@@ -310,42 +386,6 @@ CRITICAL: Return ONLY valid JSON on a single line with NO newlines, NO formattin
 
         return None
 
-    def _get_default_workout_data(self) -> Dict[str, Any]:
-        """Generate a simple default weekly workout structure"""
-        weekly_schedule = []
-
-        #Define workout focuses for variety
-        focuses = ["Upper Body", "Lower Body", "Full Body", "Core & Cardio", "Strength"]
-
-        #Create 5 days of workouts
-        for day_num in range(1, 6):
-            focus = focuses[(day_num - 1) % len(focuses)]
-            weekly_schedule.append({
-                "day": day_num,
-                "focus": focus,
-                "exercises": [
-                    {
-                        "name": "Push-ups",
-                        "type": "strength",
-                        "sets": 3,
-                        "reps": 12,
-                        "rest": 60
-                    },
-                    {
-                        "name": "Squats",
-                        "type": "strength",
-                        "sets": 3,
-                        "reps": 15,
-                        "rest": 60
-                    }
-                ],
-                "total_duration": 40
-            })
-
-        return {
-            "weekly_schedule": weekly_schedule
-        }
-    
     def _create_workout_plan(self, user_profile: UserProfile, workout_data: Dict) -> WorkoutPlan:
         """Create WorkoutPlan from data"""
 
@@ -0,0 +1,140 @@
+"""
+In-process fan-out of progress and leaderboard changes to streaming clients
+
+Each open stream is a Subscription with a small bounded queue. Progress deltas go
+only to the streams of the user who made them. Leaderboard changes are collected by
+a periodic tick instead of on every write: when the shared top-10 snapshot changes it
+is sent to everyone, and each subscriber whose rank moved (read from the in-memory
+rank index) gets their new rank.
+
+A client that does not keep up never blocks the publisher or other clients: when its
+queue is full the queued events are dropped and replaced by a single "resync" event,
+telling it to re-fetch /progress/ and /leaderboard/ once.
+"""
+import asyncio
+import json
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+
+from app.services.leaderboard_snapshot import leaderboard_snapshot
+from app.services.rank_index import rank_index
+
+
+class Subscription:
+    def __init__(self, user_id: int, max_queue: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.last_rank: Optional[int] = None
+        self.dropped = 0
+
+    def offer(self, event: str, data: dict) -> bool:
+        """Queue an event without waiting; on overflow collapse the backlog into a resync"""
+        try:
+            self.queue.put_nowait((event, data))
+            return True
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait(("resync", {}))
+            return False
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'), default=str)}\n\n"
+
+
+class Broadcaster:
+    def __init__(self, max_queue: int, tick_interval: float):
+        self.max_queue = max_queue
+        self.tick_interval = tick_interval
+        self._subscriptions: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._leaderboard_dirty = False
+        self._last_top: Optional[List[tuple]] = None
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.overflows = 0
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(user_id, self.max_queue)
+        self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.user_id]
+
+    def _deliver(self, subscription: Subscription, event: str, data: dict) -> None:
+        self.published += 1
+        if not subscription.offer(event, data):
+            self.overflows += 1
+
+    def publish_progress(self, user_id: int, changes: dict) -> None:
+        """Send a committed progress change to the user's own streams"""
+        self._leaderboard_dirty = True
+        for subscription in self._subscriptions.get(user_id, ()):
+            self._deliver(subscription, "progress", changes)
+
+    async def tick(self) -> None:
+        """Push leaderboard changes accumulated since the last tick"""
+        if not self._leaderboard_dirty or not self._subscriptions:
+            return
+        self._leaderboard_dirty = False
+
+        entries, _ = await leaderboard_snapshot.get()
+        top = [(rank, user_id, row.level, row.current_exp) for rank, user_id, row in entries]
+        if top != self._last_top:
+            self._last_top = top
+            payload = {"top_users": [
+                {"rank": rank, "username": row.username, "level": row.level, "current_exp": row.current_exp,
+                 "total_exercises_completed": row.total_exercises_completed}
+                for rank, _, row in entries
+            ]}
+            for subscriptions in self._subscriptions.values():
+                for subscription in subscriptions:
+                    self._deliver(subscription, "leaderboard", payload)
+
+        if rank_index.ready:
+            for user_id, subscriptions in self._subscriptions.items():
+                user_rank = rank_index.rank(user_id)
+                if user_rank is None:
+                    continue
+                for subscription in subscriptions:
+                    if subscription.last_rank != user_rank[0]:
+                        subscription.last_rank = user_rank[0]
+                        self._deliver(subscription, "rank", {"rank": user_rank[0]})
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                print(f"ERROR: Leaderboard push failed: {e}")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._subscriptions),
+            "connections": sum(len(subscriptions) for subscriptions in self._subscriptions.values()),
+            "published": self.published,
+            "overflows": self.overflows,
+        }
+
+
+broadcaster = Broadcaster(
+    max_queue=int(os.getenv("STREAM_MAX_QUEUE", "32")),
+    tick_interval=float(os.getenv("STREAM_TICK_SECONDS", "1")),
+)
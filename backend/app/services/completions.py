@@ -0,0 +1,369 @@
+import re
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select, delete, insert, update, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.db_models import ExerciseCompletion, ProgressEvent, UserProgress
+from app.services.progression import apply_exp, exp_gain
+from app.services.activity import record_activity, utc_today
+
+#(week, day, exercise_index)
+Slot = Tuple[int, int, int]
+
+_KEY_PATTERN = re.compile(r"^week(\d+)-day(\d+)-exercise(\d+)$")
+
+#Offline events older than this are booked on the oldest day still accepted
+MAX_EVENT_AGE = timedelta(days=30)
+
+
+def completion_key(week: int, day: int, exercise_index: int) -> str:
+    """Build the key the frontend uses for a completed exercise"""
+    return f"week{week}-day{day}-exercise{exercise_index}"
+
+
+def parse_completion_key(key: str) -> Optional[Slot]:
+    """Parse "week1-day2-exercise0" into (1, 2, 0); returns None for anything else"""
+    match = _KEY_PATTERN.match(key)
+    if not match:
+        return None
+    return tuple(int(part) for part in match.groups())
+
+
+def slots_from_dict(completed_exercises: dict) -> Set[Slot]:
+    """Turn a {key: true} completion dict into a set of slots, skipping unknown keys"""
+    slots = set()
+    for key, done in completed_exercises.items():
+        slot = parse_completion_key(key)
+        if done and slot is not None:
+            slots.add(slot)
+    return slots
+
+
+async def load_completed_slots(db: AsyncSession, user_id: int) -> Set[Slot]:
+    result = await db.execute(
+        select(ExerciseCompletion.week, ExerciseCompletion.day, ExerciseCompletion.exercise_index)
+        .where(ExerciseCompletion.user_id == user_id)
+    )
+    return {tuple(row) for row in result.all()}
+
+
+async def load_completed_exercises(db: AsyncSession, user_id: int) -> Dict[str, bool]:
+    """Build the legacy {"week1-day1-exercise0": true} dict from the completion table"""
+    slots = await load_completed_slots(db, user_id)
+    return {completion_key(*slot): True for slot in sorted(slots)}
+
+
+async def add_completions(db: AsyncSession, user_id: int, slots: Iterable[Slot]) -> None:
+    rows = [
+        {"user_id": user_id, "week": week, "day": day, "exercise_index": exercise_index}
+        for week, day, exercise_index in slots
+    ]
+    if rows:
+        await db.execute(insert(ExerciseCompletion), rows)
+
+
+async def remove_completions(db: AsyncSession, user_id: int, slots: Iterable[Slot]) -> List[Tuple[int, Optional[datetime]]]:
+    """Delete completions; returns (exp_earned, completed_at) of each removed row"""
+    slots = list(slots)
+    if not slots:
+        return []
+    result = await db.execute(
+        delete(ExerciseCompletion)
+        .where(
+            ExerciseCompletion.user_id == user_id,
+            tuple_(ExerciseCompletion.week, ExerciseCompletion.day, ExerciseCompletion.exercise_index).in_(slots)
+        )
+        .returning(ExerciseCompletion.exp_earned, ExerciseCompletion.completed_at)
+    )
+    return [tuple(row) for row in result.all()]
+
+
+def completion_day(completed_at: Optional[datetime]) -> Optional[date]:
+    """UTC day a completion counts for; None (today) for rows from before completed_at was set"""
+    return completed_at.date() if completed_at is not None else None
+
+
+def event_time(occurred_at: Optional[datetime], now: datetime) -> datetime:
+    """Naive UTC time of an offline event, clamped to the last MAX_EVENT_AGE and never in the future"""
+    if occurred_at is None:
+        return now
+    if occurred_at.tzinfo is not None:
+        occurred_at = occurred_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return min(now, max(now - MAX_EVENT_AGE, occurred_at))
+
+
+async def lock_progress(db: AsyncSession, user_id: int) -> bool:
+    """Lock the user's progress row for this transaction; False if they have none
+
+    Every writer of the event log takes this lock before inserting, so one user's
+    event ids are allocated and committed in the same order and a sync cursor never
+    passes an id that commits later.
+    """
+    return await db.scalar(
+        select(UserProgress.id).where(UserProgress.user_id == user_id).with_for_update()
+    ) is not None
+
+
+async def log_events(db: AsyncSession, user_id: int, events: List[dict]) -> None:
+    """Append rows to the progress event log that sync cursors read from
+
+    The caller must hold lock_progress for the user.
+
+    Each event is a dict with action, week, day, exercise_index and optionally
+    exp_delta and idempotency_key.
+    """
+    if events:
+        await db.execute(insert(ProgressEvent), [{"user_id": user_id, **event} for event in events])
+
+
+def _slot_event(action: str, slot: Slot, exp_delta: int = 0) -> dict:
+    week, day, exercise_index = slot
+    return {"action": action, "week": week, "day": day, "exercise_index": exercise_index, "exp_delta": exp_delta}
+
+
+async def replace_completed_exercises(db: AsyncSession, user_id: int, completed_exercises: dict, exp_delta: int = 0) -> None:
+    """Make the table match a full completion dict, writing only the rows that changed
+
+    exp_delta is the EXP the same save gained (or lost); it is booked on today.
+    """
+    await lock_progress(db, user_id)
+    wanted = slots_from_dict(completed_exercises)
+    existing = await load_completed_slots(db, user_id)
+    added, removed = wanted - existing, existing - wanted
+    await add_completions(db, user_id, added)
+    removed_rows = await remove_completions(db, user_id, removed)
+    await log_events(
+        db, user_id,
+        [_slot_event("complete", slot) for slot in sorted(added)] +
+        [_slot_event("uncomplete", slot) for slot in sorted(removed)]
+    )
+    #Removals come off the days the exercises were completed on
+    today = utc_today()
+    removed_by_day = defaultdict(int)
+    for _, completed_at in removed_rows:
+        removed_by_day[completion_day(completed_at) or today] += 1
+    for day, count in sorted(removed_by_day.items()):
+        if day != today:
+            await record_activity(db, user_id, -count, 0, day=day)
+    await record_activity(db, user_id, len(added) - removed_by_day[today], exp_delta, day=today, active=bool(added))
+
+
+async def record_progress_save(db: AsyncSession, user_id: int, completed_exercises: Optional[dict], exp_delta: int) -> None:
+    """Book a full progress save (PUT /progress/): its completion changes and its EXP delta
+
+    The frontend reports EXP as level / current_exp, so the gain is the difference
+    in lifetime EXP between the stored and the saved values.
+    """
+    if completed_exercises is not None:
+        await replace_completed_exercises(db, user_id, completed_exercises, exp_delta)
+    elif exp_delta:
+        await record_activity(db, user_id, 0, exp_delta)
+
+
+async def clear_completions(db: AsyncSession, user_id: int) -> None:
+    await db.execute(delete(ExerciseCompletion).where(ExerciseCompletion.user_id == user_id))
+
+
+async def _apply_progress_delta(db: AsyncSession, user_id: int, exp_delta: int, count_delta: int) -> Optional[dict]:
+    """Atomically add EXP and completions to a user's progress row; returns the changed fields
+
+    The increment is a single UPDATE ... RETURNING, so concurrent requests cannot lose
+    each other's changes. Only when that crosses a level boundary is a second UPDATE
+    needed, and it runs while the first one still holds the row lock.
+    """
+    result = await db.execute(
+        update(UserProgress)
+        .where(UserProgress.user_id == user_id)
+        .values(
+            current_exp=UserProgress.current_exp + exp_delta,
+            total_exercises_completed=UserProgress.total_exercises_completed + count_delta
+        )
+        .returning(
+            UserProgress.level,
+            UserProgress.current_exp,
+            UserProgress.exp_to_next_level,
+            UserProgress.total_exercises_completed
+        )
+    )
+    row = result.one_or_none()
+    if row is None:
+        return None
+
+    changed = {"total_exercises_completed": row.total_exercises_completed}
+    if exp_delta:
+        changed["current_exp"] = row.current_exp
+
+    level, exp, exp_to_next_level = apply_exp(row.level, row.current_exp, 0)
+    if (level, exp, exp_to_next_level) != (row.level, row.current_exp, row.exp_to_next_level):
+        await db.execute(
+            update(UserProgress)
+            .where(UserProgress.user_id == user_id)
+            .values(level=level, current_exp=exp, exp_to_next_level=exp_to_next_level)
+        )
+        changed.update(level=level, current_exp=exp, exp_to_next_level=exp_to_next_level)
+    return changed
+
+
+async def mark_completed(db: AsyncSession, user_id: int, slot: Slot, exp_gained: int) -> Optional[dict]:
+    """Record one completion and award its EXP
+
+    Returns the changed progress fields, {} if the exercise was already completed,
+    or None if the user has no progress row.
+    """
+    if not await lock_progress(db, user_id):
+        return None
+    week, day, exercise_index = slot
+    try:
+        async with db.begin_nested():
+            await db.execute(insert(ExerciseCompletion).values(
+                user_id=user_id, week=week, day=day, exercise_index=exercise_index, exp_earned=exp_gained
+            ))
+    except IntegrityError:
+        #The unique (user_id, week, day, exercise_index) index makes repeats a no-op
+        return {}
+    await log_events(db, user_id, [_slot_event("complete", slot, exp_gained)])
+    await record_activity(db, user_id, 1, exp_gained)
+    return await _apply_progress_delta(db, user_id, exp_gained, 1)
+
+
+async def unmark_completed(db: AsyncSession, user_id: int, slot: Slot) -> Optional[dict]:
+    """Remove one completion and take back the EXP it earned
+
+    Returns the changed progress fields, {} if the exercise was not completed,
+    or None if the user has no progress row.
+    """
+    if not await lock_progress(db, user_id):
+        return None
+    week, day, exercise_index = slot
+    result = await db.execute(
+        delete(ExerciseCompletion)
+        .where(
+            ExerciseCompletion.user_id == user_id,
+            ExerciseCompletion.week == week,
+            ExerciseCompletion.day == day,
+            ExerciseCompletion.exercise_index == exercise_index
+        )
+        .returning(ExerciseCompletion.exp_earned, ExerciseCompletion.completed_at)
+    )
+    row = result.one_or_none()
+    if row is None:
+        return {}
+    exp_earned = row.exp_earned
+    await log_events(db, user_id, [_slot_event("uncomplete", slot, -exp_earned)])
+    #Taken back from the day (and week / month) the EXP was earned on, not today
+    await record_activity(db, user_id, -1, -exp_earned, day=completion_day(row.completed_at))
+    return await _apply_progress_delta(db, user_id, -exp_earned, -1)
+
+
+async def apply_event_batch(db: AsyncSession, user_id: int, events: list) -> Tuple[List[str], List[str], Optional[dict]]:
+    """Apply an ordered batch of offline completion events in the caller's transaction
+
+    `events` are SyncEvent models. Events whose idempotency key was already applied
+    (in an earlier batch or earlier in this one) are skipped. The rest are folded in
+    order in memory, so the database sees one bulk delete, one bulk insert of
+    completions, one bulk insert into the event log and one progress UPDATE.
+
+    A completion is booked on the day of the event's occurred_at (see event_time),
+    and an uncomplete comes off the day the exercise was completed on, so offline
+    days show up in the history and extend the streak.
+
+    Returns (applied keys, duplicate keys, changed progress fields). The progress
+    fields are None if the user has no progress row.
+    """
+    if not await lock_progress(db, user_id):
+        return [], [], None
+    keys = [event.idempotency_key for event in events]
+    seen = set(await db.scalars(
+        select(ProgressEvent.idempotency_key)
+        .where(ProgressEvent.user_id == user_id, ProgressEvent.idempotency_key.in_(keys))
+    )) if keys else set()
+
+    fresh, duplicates = [], []
+    for event in events:
+        if event.idempotency_key in seen:
+            duplicates.append(event.idempotency_key)
+        else:
+            seen.add(event.idempotency_key)
+            fresh.append(event)
+    if not fresh:
+        return [], duplicates, {}
+
+    #Current state of just the slots this batch touches: slot -> (exp_earned, completed_at)
+    touched = list({(e.week, e.day, e.exercise_index) for e in fresh})
+    result = await db.execute(
+        select(
+            ExerciseCompletion.week, ExerciseCompletion.day, ExerciseCompletion.exercise_index,
+            ExerciseCompletion.exp_earned, ExerciseCompletion.completed_at
+        )
+        .where(
+            ExerciseCompletion.user_id == user_id,
+            tuple_(ExerciseCompletion.week, ExerciseCompletion.day, ExerciseCompletion.exercise_index).in_(touched)
+        )
+    )
+    existing = {(week, day, index): (exp, completed_at) for week, day, index, exp, completed_at in result.all()}
+    state = dict(existing)
+
+    now = datetime.utcnow()
+    log_rows = []
+    exp_delta = 0
+    count_delta = 0
+    #UTC day -> [exercise delta, EXP delta]; a day with more completions than removals is active
+    days = defaultdict(lambda: [0, 0])
+    for event in fresh:
+        slot = (event.week, event.day, event.exercise_index)
+        change = 0
+        if event.action == "complete" and slot not in state:
+            change = exp_gain(event.type, event.sets)
+            completed_at = event_time(event.occurred_at, now)
+            state[slot] = (change, completed_at)
+            count_delta += 1
+            days[completed_at.date()][0] += 1
+            days[completed_at.date()][1] += change
+        elif event.action == "uncomplete" and slot in state:
+            earned, completed_at = state.pop(slot)
+            change = -earned
+            count_delta -= 1
+            day = completion_day(completed_at) or now.date()
+            days[day][0] -= 1
+            days[day][1] += change
+        exp_delta += change
+        #No-op events are still logged so their key is never applied twice
+        log_rows.append({**_slot_event(event.action, slot, change), "idempotency_key": event.idempotency_key})
+
+    #A slot that was removed and re-added in the batch is rewritten with its new EXP
+    removed = [slot for slot in existing if state.get(slot) != existing[slot]]
+    added = [slot for slot in state if existing.get(slot) != state[slot]]
+
+    await remove_completions(db, user_id, removed)
+    if added:
+        await db.execute(insert(ExerciseCompletion), [
+            {
+                "user_id": user_id, "week": week, "day": day, "exercise_index": index,
+                "exp_earned": state[(week, day, index)][0], "completed_at": state[(week, day, index)][1]
+            }
+            for week, day, index in added
+        ])
+    await log_events(db, user_id, log_rows)
+    #Oldest day first, so consecutive offline days extend the streak one after another
+    for day, (exercise_delta, day_exp) in sorted(days.items()):
+        await record_activity(db, user_id, exercise_delta, day_exp, day=day)
+
+    changed = {}
+    if exp_delta or count_delta:
+        changed = await _apply_progress_delta(db, user_id, exp_delta, count_delta)
+    return [event.idempotency_key for event in fresh], duplicates, changed
+
+
+async def load_events_since(db: AsyncSession, user_id: int, cursor: int, limit: int) -> List[ProgressEvent]:
+    """Progress events after `cursor` in server sequence order"""
+    result = await db.scalars(
+        select(ProgressEvent)
+        .where(ProgressEvent.user_id == user_id, ProgressEvent.id > cursor)
+        .order_by(ProgressEvent.id)
+        .limit(limit)
+    )
+    return list(result)
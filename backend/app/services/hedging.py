@@ -0,0 +1,132 @@
+"""
+Hedged requests across the model list
+
+The first model starts immediately. If it has not answered after the hedge delay,
+the next model is started alongside it; the first attempt that returns a valid plan
+wins and the others are cancelled. An attempt that fails outright starts the next
+model at once, so a dead model costs one failed request instead of its timeout.
+
+The hedge delay is a percentile (HF_HEDGE_PERCENTILE, default p95) of recent
+successful attempt latencies, so only the slowest few percent of generations send a
+second request. With HF_HEDGE_REQUESTS=false models are tried strictly in order.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, List, Optional
+
+
+class HedgePolicy:
+    def __init__(
+        self,
+        enabled: bool,
+        percentile: float,
+        initial_delay: float,
+        min_delay: float,
+        window: int,
+        min_samples: int,
+        max_inflight: int
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.max_inflight = max_inflight
+        self._latencies: deque = deque(maxlen=window)
+        self.runs = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self.cancelled = 0
+
+    def observe(self, seconds: float) -> None:
+        """Record the latency of a successful attempt"""
+        self._latencies.append(seconds)
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait on the attempts in flight before hedging; None never hedges"""
+        if not self.enabled:
+            return None
+        if len(self._latencies) < self.min_samples:
+            return self.initial_delay
+        ordered = sorted(self._latencies)
+        return max(self.min_delay, ordered[int(self.percentile / 100 * (len(ordered) - 1))])
+
+    async def run(self, attempts: List[Callable[[], Awaitable]]):
+        """Result of the first attempt that succeeds; raises the last error if none does
+
+        attempts are started in order: the next one on a failure, or after delay()
+        while fewer than max_inflight are running.
+        """
+        self.runs += 1
+        delay = self.delay()
+        queue = deque(attempts)
+        #task -> whether it was started as a hedge (rather than first, or after a failure)
+        running = {}
+        last_error: Optional[BaseException] = None
+
+        def launch(hedge: bool) -> None:
+            running[asyncio.ensure_future(self._timed(queue.popleft()))] = hedge
+
+        launch(False)
+        try:
+            while running:
+                can_hedge = delay is not None and queue and len(running) < self.max_inflight
+                done, _ = await asyncio.wait(
+                    running, timeout=delay if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self.hedges += 1
+                    launch(True)
+                    continue
+
+                #A success wins even if another attempt failed in the same wake-up
+                for task in sorted(done, key=lambda task: task.exception() is not None):
+                    hedge = running.pop(task)
+                    if task.exception() is None:
+                        if hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+                    last_error = task.exception()
+                    if queue:
+                        self.failovers += 1
+                        launch(False)
+        finally:
+            for task in running:
+                task.cancel()
+                self.cancelled += 1
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        raise last_error
+
+    async def _timed(self, attempt: Callable[[], Awaitable]):
+        started = time.perf_counter()
+        result = await attempt()
+        self.observe(time.perf_counter() - started)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "delay_seconds": round(self.delay(), 3) if self.enabled else None,
+            "samples": len(self._latencies),
+            "runs": self.runs,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "cancelled": self.cancelled,
+        }
+
+
+hedge_policy = HedgePolicy(
+    enabled=os.getenv("HF_HEDGE_REQUESTS", "true").lower() in ("1", "true", "yes"),
+    percentile=float(os.getenv("HF_HEDGE_PERCENTILE", "95")),
+    initial_delay=float(os.getenv("HF_HEDGE_DELAY_SECONDS", "8")),
+    min_delay=float(os.getenv("HF_HEDGE_MIN_DELAY_SECONDS", "1")),
+    window=int(os.getenv("HF_HEDGE_WINDOW", "200")),
+    min_samples=int(os.getenv("HF_HEDGE_MIN_SAMPLES", "20")),
+    max_inflight=int(os.getenv("HF_HEDGE_MAX_INFLIGHT", "2")),
+)
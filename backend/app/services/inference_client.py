@@ -0,0 +1,85 @@
+"""
+Shared async HTTP client for the Hugging Face chat completions API
+
+One httpx.AsyncClient per worker keeps a pool of keep-alive connections, so
+generations after the first skip the TCP and TLS handshakes. Each phase of a call
+has its own timeout (connect, write, read, waiting for a pooled connection) instead
+of one 60 second budget, and requests never block the event loop.
+"""
+import os
+from typing import Optional
+
+import httpx
+
+HUGGINGFACE_API_URL = os.getenv("HUGGINGFACE_API_URL", "https://router.huggingface.co/v1/chat/completions")
+
+
+class InferenceClient:
+    def __init__(self, api_url: str, timeout: httpx.Timeout, limits: httpx.Limits):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.limits = limits
+        self._client: Optional[httpx.AsyncClient] = None
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        #Opened on first use too, so scripts that never run the lifespan still work
+        if self._client is None or self._client.is_closed:
+            self.start()
+        return self._client
+
+    async def complete(self, payload: dict, token: str) -> httpx.Response:
+        """POST one chat completion request; raises httpx.TimeoutException per phase"""
+        self.requests += 1
+        try:
+            return await self.client.post(
+                self.api_url,
+                json=payload,
+                headers={"Authorization": f"Bearer {token}"}
+            )
+        except httpx.TimeoutException:
+            self.timeouts += 1
+            raise
+        except httpx.HTTPError:
+            self.errors += 1
+            raise
+
+    def start(self) -> None:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+
+    async def stop(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "max_connections": self.limits.max_connections,
+        }
+
+
+#Keep every pooled connection alive: with fewer keep-alive slots than connections,
+#httpx closes the surplus on release even while requests are queued for one
+MAX_CONNECTIONS = int(os.getenv("HF_MAX_CONNECTIONS", "20"))
+
+inference_client = InferenceClient(
+    api_url=HUGGINGFACE_API_URL,
+    timeout=httpx.Timeout(
+        connect=float(os.getenv("HF_CONNECT_TIMEOUT_SECONDS", "5")),
+        write=float(os.getenv("HF_WRITE_TIMEOUT_SECONDS", "10")),
+        read=float(os.getenv("HF_READ_TIMEOUT_SECONDS", "60")),
+        pool=float(os.getenv("HF_POOL_TIMEOUT_SECONDS", "5")),
+    ),
+    limits=httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=int(os.getenv("HF_MAX_KEEPALIVE", str(MAX_CONNECTIONS))),
+        keepalive_expiry=float(os.getenv("HF_KEEPALIVE_SECONDS", "60")),
+    ),
+)
@@ -0,0 +1,106 @@
+"""
+Leaderboard queries
+
+Users are ordered by (level DESC, current_exp DESC, user_id ASC), which is exactly
+the ix_user_progress_rank index, so the top of the board is a LIMIT over the index
+and a user's rank is a count of the index entries in front of them.
+
+Pages continue from a (level, current_exp, user_id) key. The key splits the rest of
+the board into three index ranges (same level and EXP, same level, lower levels),
+each read with its own LIMIT, so a page costs a few seeks however deep it is.
+"""
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.db_models import User, UserProgress
+
+LEADERBOARD_ORDER = (
+    UserProgress.level.desc(),
+    UserProgress.current_exp.desc(),
+    UserProgress.user_id.asc()
+)
+
+
+def _entry_query():
+    return select(
+        User.username,
+        UserProgress.level,
+        UserProgress.current_exp,
+        UserProgress.total_exercises_completed,
+        UserProgress.user_id
+    ).join(User, User.id == UserProgress.user_id)
+
+
+async def load_top(db: AsyncSession, limit: int = 10) -> List[Row]:
+    """The first `limit` rows of the leaderboard; rank is position + 1"""
+    result = await db.execute(_entry_query().order_by(*LEADERBOARD_ORDER).limit(limit))
+    return list(result.all())
+
+
+def _count_ahead(level: int, current_exp: int, user_id: int):
+    """Rows ranked before (level, current_exp, user_id), as three index range counts"""
+    def count(*criteria):
+        return select(func.count()).select_from(UserProgress).where(*criteria).scalar_subquery()
+
+    return select(
+        count(UserProgress.level > level)
+        + count(UserProgress.level == level, UserProgress.current_exp > current_exp)
+        + count(UserProgress.level == level, UserProgress.current_exp == current_exp, UserProgress.user_id < user_id)
+    )
+
+
+async def load_user_rank(db: AsyncSession, user_id: int) -> Optional[Tuple[int, Row]]:
+    """(rank, row) for one user, or None if they have no progress yet"""
+    result = await db.execute(_entry_query().where(UserProgress.user_id == user_id))
+    row = result.one_or_none()
+    if row is None:
+        return None
+    ahead = await db.scalar(_count_ahead(row.level, row.current_exp, row.user_id))
+    return ahead + 1, row
+
+
+#(level, current_exp, user_id) of a leaderboard row
+Key = Tuple[int, int, int]
+
+
+async def load_after(db: AsyncSession, key: Key, limit: int) -> List[Row]:
+    """Up to `limit` rows ranked after `key`, in leaderboard order"""
+    level, current_exp, user_id = key
+    ranges = (
+        ((UserProgress.level == level, UserProgress.current_exp == current_exp, UserProgress.user_id > user_id),
+         (UserProgress.user_id.asc(),)),
+        ((UserProgress.level == level, UserProgress.current_exp < current_exp),
+         (UserProgress.current_exp.desc(), UserProgress.user_id.asc())),
+        ((UserProgress.level < level,), LEADERBOARD_ORDER),
+    )
+    rows = []
+    for criteria, order in ranges:
+        if len(rows) >= limit:
+            break
+        result = await db.execute(_entry_query().where(*criteria).order_by(*order).limit(limit - len(rows)))
+        rows.extend(result.all())
+    return rows
+
+
+async def load_before(db: AsyncSession, key: Key, limit: int) -> List[Row]:
+    """Up to `limit` rows ranked directly before `key`, in leaderboard order"""
+    level, current_exp, user_id = key
+    ranges = (
+        ((UserProgress.level == level, UserProgress.current_exp == current_exp, UserProgress.user_id < user_id),
+         (UserProgress.user_id.desc(),)),
+        ((UserProgress.level == level, UserProgress.current_exp > current_exp),
+         (UserProgress.current_exp.asc(), UserProgress.user_id.desc())),
+        ((UserProgress.level > level,),
+         (UserProgress.level.asc(), UserProgress.current_exp.asc(), UserProgress.user_id.desc())),
+    )
+    rows = []
+    for criteria, order in ranges:
+        if len(rows) >= limit:
+            break
+        result = await db.execute(_entry_query().where(*criteria).order_by(*order).limit(limit - len(rows)))
+        rows.extend(result.all())
+    rows.reverse()
+    return rows
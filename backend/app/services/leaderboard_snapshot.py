@@ -0,0 +1,109 @@
+"""
+Shared snapshot of the top of the leaderboard (stale-while-revalidate)
+
+GET /leaderboard/ serves the top users from one in-memory snapshot. Once it is older
+than LEADERBOARD_SNAPSHOT_SECONDS, or LEADERBOARD_SNAPSHOT_WRITES progress writes
+have happened since it was built, a single background refresh is started and
+requests keep getting the current snapshot until the new one is ready. Only the very
+first request waits for a build.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from typing import List, Optional, Tuple
+
+from app.database import SessionLocal
+from app.services.leaderboard import load_top
+from app.services.rank_index import rank_index
+
+
+class LeaderboardSnapshot:
+    def __init__(self, size: int, max_age: float, max_writes: int):
+        self.size = size
+        self.max_age = max_age
+        self.max_writes = max_writes
+        self._entries: Optional[List[Tuple[int, int, object]]] = None
+        #Digest of the entries' visible fields, identical on every worker that sees the same top
+        self.fingerprint = ""
+        self._built_at = 0.0
+        self._writes = 0
+        self._refresh: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.served = 0
+
+    async def _build(self) -> None:
+        built_at = time.monotonic()
+        writes = self._writes
+        if rank_index.ready:
+            entries = rank_index.top(self.size)
+        else:
+            async with SessionLocal() as db:
+                rows = await load_top(db, self.size)
+            entries = [(rank, row.user_id, row) for rank, row in enumerate(rows, start=1)]
+        self._entries = entries
+        self.fingerprint = hashlib.sha1(repr([
+            (rank, user_id, row.username, row.level, row.current_exp, row.total_exercises_completed)
+            for rank, user_id, row in entries
+        ]).encode()).hexdigest()
+        self._built_at = built_at
+        #Writes that arrived during the build still count towards the next refresh
+        self._writes -= writes
+        self.refreshes += 1
+
+    async def _run_refresh(self) -> None:
+        try:
+            await self._build()
+        except Exception as e:
+            print(f"ERROR: Leaderboard snapshot refresh failed: {e}")
+        finally:
+            self._refresh = None
+
+    def _trigger_refresh(self) -> None:
+        if self._refresh is None:
+            self._refresh = asyncio.get_running_loop().create_task(self._run_refresh())
+
+    def is_stale(self) -> bool:
+        return self.age() >= self.max_age or self._writes >= self.max_writes
+
+    def age(self) -> float:
+        """Seconds since the current snapshot was built"""
+        return time.monotonic() - self._built_at
+
+    def note_write(self) -> None:
+        """Count a progress write; refreshes in the background after max_writes"""
+        self._writes += 1
+        if self._entries is not None and self._writes >= self.max_writes:
+            try:
+                self._trigger_refresh()
+            except RuntimeError:
+                #No running event loop (e.g. a maintenance script); the next read refreshes
+                pass
+
+    async def get(self) -> Tuple[List[Tuple[int, int, object]], float]:
+        """(entries as (rank, user_id, row), age in seconds); stale entries trigger one refresh"""
+        if self._entries is None:
+            self._trigger_refresh()
+            await asyncio.shield(self._refresh)
+            if self._entries is None:
+                raise RuntimeError("Leaderboard snapshot could not be built")
+        elif self.is_stale():
+            self._trigger_refresh()
+        self.served += 1
+        return self._entries, self.age()
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "age_seconds": round(self.age(), 3) if self._entries is not None else None,
+            "pending_writes": self._writes,
+            "refreshes": self.refreshes,
+            "served": self.served,
+        }
+
+
+leaderboard_snapshot = LeaderboardSnapshot(
+    size=10,
+    max_age=float(os.getenv("LEADERBOARD_SNAPSHOT_SECONDS", "30")),
+    max_writes=int(os.getenv("LEADERBOARD_SNAPSHOT_WRITES", "100")),
+)
@@ -0,0 +1,187 @@
+"""
+Per-model health, circuit breaking and latency-aware routing for AI generation
+
+Every finished attempt is recorded for its model: the outcome (ok, error, timeout
+or parse failure) in a rolling window, and its latency in an EWMA. A model whose
+window fails at least HF_BREAKER_FAILURE_RATE of the time is opened and skipped.
+Each further failure doubles its cooldown, up to HF_BREAKER_MAX_COOLDOWN_SECONDS.
+Once the cooldown is over the breaker is half-open: the next generation uses the
+model as a probe, one request at a time. A successful probe closes the breaker and
+a failed one reopens it.
+
+Generations try healthy models in order of expected time to a usable plan, which
+is the latency EWMA divided by the smoothed success rate. The configured model
+order only breaks ties, for example between models without samples. So that a
+model nobody routes to still gets measured, HF_ROUTER_EXPLORE_RATE of generations
+start with a random other healthy model (the best one still follows it, and
+hedging covers a slow pick).
+"""
+import os
+import random
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+OUTCOMES = ("ok", "error", "timeout", "parse")
+
+
+class ModelHealth:
+    def __init__(self, model: str, window: int, alpha: float):
+        self.model = model
+        self.alpha = alpha
+        self.outcomes: deque = deque(maxlen=window)
+        self.latency_ewma: Optional[float] = None
+        self.state = CLOSED
+        self.opened_until = 0.0
+        self.cooldown = 0.0
+        self.probing = False
+        self.totals = dict.fromkeys(OUTCOMES, 0)
+
+    def success_rate(self) -> float:
+        """Share of ok outcomes, smoothed towards 1/2 so a handful of samples cannot reach 0 or 1"""
+        return (self.outcomes.count("ok") + 1) / (len(self.outcomes) + 2)
+
+    def rate(self, outcome: str) -> float:
+        return self.outcomes.count(outcome) / len(self.outcomes) if self.outcomes else 0.0
+
+    def expected_seconds(self, prior_latency: float) -> float:
+        """Expected time to a usable plan: attempt latency over success rate"""
+        latency = self.latency_ewma if self.latency_ewma is not None else prior_latency
+        return latency / self.success_rate()
+
+    def record(self, outcome: str, seconds: float) -> None:
+        self.outcomes.append(outcome)
+        self.totals[outcome] += 1
+        if self.latency_ewma is None:
+            self.latency_ewma = seconds
+        else:
+            self.latency_ewma += self.alpha * (seconds - self.latency_ewma)
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        window: int,
+        alpha: float,
+        min_requests: int,
+        failure_rate: float,
+        cooldown: float,
+        max_cooldown: float,
+        prior_latency: float,
+        explore_rate: float
+    ):
+        self.window = window
+        self.alpha = alpha
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.prior_latency = prior_latency
+        self.explore_rate = explore_rate
+        self._models: Dict[str, ModelHealth] = {}
+        self.skipped = 0
+        self.explored = 0
+
+    def health(self, model: str) -> ModelHealth:
+        if model not in self._models:
+            self._models[model] = ModelHealth(model, self.window, self.alpha)
+        return self._models[model]
+
+    def _refresh(self, health: ModelHealth, now: float) -> None:
+        if health.state == OPEN and now >= health.opened_until:
+            health.state = HALF_OPEN
+
+    def route(self, models: List[str]) -> List[str]:
+        """Models to try for one generation, best first; open breakers are left out
+
+        A half-open model with no probe in flight goes first so that it is probed.
+        """
+        now = time.monotonic()
+        probes, healthy = [], []
+        for position, model in enumerate(models):
+            health = self.health(model)
+            self._refresh(health, now)
+            if health.state == CLOSED:
+                healthy.append((health.expected_seconds(self.prior_latency), position, model))
+            elif health.state == HALF_OPEN and not health.probing:
+                probes.append(model)
+            else:
+                self.skipped += 1
+        ranked = [model for _, _, model in sorted(healthy)]
+        if len(ranked) > 1 and random.random() < self.explore_rate:
+            self.explored += 1
+            ranked.insert(0, ranked.pop(random.randrange(1, len(ranked))))
+        return probes + ranked
+
+    def begin(self, model: str) -> bool:
+        """Claim the model for an attempt; False when its breaker no longer allows one"""
+        health = self.health(model)
+        self._refresh(health, time.monotonic())
+        if health.state == CLOSED:
+            return True
+        if health.state == HALF_OPEN and not health.probing:
+            health.probing = True
+            return True
+        self.skipped += 1
+        return False
+
+    def cancel(self, model: str) -> None:
+        """The attempt was abandoned (a hedge lost) without an outcome"""
+        self.health(model).probing = False
+
+    def record(self, model: str, outcome: str, seconds: float) -> None:
+        health = self.health(model)
+        health.record(outcome, seconds)
+        now = time.monotonic()
+        if health.state == HALF_OPEN:
+            health.probing = False
+            if outcome == "ok":
+                health.state = CLOSED
+                health.cooldown = 0.0
+                #Start the window afresh so old failures do not reopen it straight away
+                health.outcomes.clear()
+                health.outcomes.append(outcome)
+            else:
+                self._open(health, now)
+        elif health.state == CLOSED and outcome != "ok":
+            if len(health.outcomes) >= self.min_requests and 1 - health.rate("ok") >= self.failure_rate:
+                self._open(health, now)
+
+    def _open(self, health: ModelHealth, now: float) -> None:
+        health.cooldown = min(self.max_cooldown, health.cooldown * 2 or self.base_cooldown)
+        health.opened_until = now + health.cooldown
+        health.state = OPEN
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        models = {}
+        for model, health in self._models.items():
+            self._refresh(health, now)
+            models[model] = {
+                "state": health.state,
+                "success_rate": round(health.rate("ok"), 3) if health.outcomes else None,
+                "parse_failure_rate": round(health.rate("parse"), 3) if health.outcomes else None,
+                "timeout_rate": round(health.rate("timeout"), 3) if health.outcomes else None,
+                "latency_ewma_seconds": round(health.latency_ewma, 3) if health.latency_ewma is not None else None,
+                "expected_seconds": round(health.expected_seconds(self.prior_latency), 3),
+                "reopens_in_seconds": round(health.opened_until - now, 1) if health.state == OPEN else None,
+                "samples": len(health.outcomes),
+                "totals": dict(health.totals),
+            }
+        return {"skipped": self.skipped, "explored": self.explored, "models": models}
+
+
+model_router = ModelRouter(
+    window=int(os.getenv("HF_HEALTH_WINDOW", "50")),
+    alpha=float(os.getenv("HF_LATENCY_EWMA_ALPHA", "0.2")),
+    min_requests=int(os.getenv("HF_BREAKER_MIN_REQUESTS", "5")),
+    failure_rate=float(os.getenv("HF_BREAKER_FAILURE_RATE", "0.5")),
+    cooldown=float(os.getenv("HF_BREAKER_COOLDOWN_SECONDS", "30")),
+    max_cooldown=float(os.getenv("HF_BREAKER_MAX_COOLDOWN_SECONDS", "900")),
+    prior_latency=float(os.getenv("HF_ROUTER_PRIOR_LATENCY_SECONDS", "10")),
+    explore_rate=float(os.getenv("HF_ROUTER_EXPLORE_RATE", "0.05")),
+)
@@ -0,0 +1,153 @@
+"""
+Weekly and monthly leaderboards
+
+Every EXP change adds to one period_exp row per period (the ISO week and the
+calendar month of the UTC day it happened). The ix_period_exp_rank index keeps each
+period's rows in ranking order, so the board is read like the lifetime leaderboard:
+a LIMIT over the index for the top and a COUNT of the entries in front for a rank.
+Periods older than the retention window, and empty rows of closed periods, are
+deleted by a scheduled compaction.
+"""
+import asyncio
+import os
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import SessionLocal
+from app.models.db_models import PeriodExp, User
+
+PERIODS = ("week", "month")
+
+RETENTION = {
+    "week": int(os.getenv("PERIOD_LEADERBOARD_WEEKS", "12")),
+    "month": int(os.getenv("PERIOD_LEADERBOARD_MONTHS", "12")),
+}
+
+
+def period_start(period: str, day: date) -> date:
+    """First day of the week (Monday) or month containing `day`"""
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def oldest_retained(period: str, today: date) -> date:
+    """Start of the oldest period that is kept"""
+    start = period_start(period, today)
+    if period == "week":
+        return start - timedelta(weeks=RETENTION["week"] - 1)
+    months = start.year * 12 + start.month - 1 - (RETENTION["month"] - 1)
+    return date(months // 12, months % 12 + 1, 1)
+
+
+async def add_period_exp(db: AsyncSession, user_id: int, day: date, exp_delta: int) -> None:
+    """Add EXP to the user's week and month totals for `day`"""
+    if not exp_delta:
+        return
+    for period in PERIODS:
+        start = period_start(period, day)
+        where = (PeriodExp.user_id == user_id, PeriodExp.period == period, PeriodExp.period_start == start)
+        values = {"exp_earned": PeriodExp.exp_earned + exp_delta}
+        result = await db.execute(update(PeriodExp).where(*where).values(**values))
+        if result.rowcount == 0:
+            try:
+                async with db.begin_nested():
+                    await db.execute(insert(PeriodExp).values(
+                        user_id=user_id, period=period, period_start=start, exp_earned=exp_delta
+                    ))
+            except IntegrityError:
+                #Another request created the row first
+                await db.execute(update(PeriodExp).where(*where).values(**values))
+
+
+def _period_query(period: str, start: date):
+    return (
+        select(User.username, PeriodExp.exp_earned, PeriodExp.user_id)
+        .join(User, User.id == PeriodExp.user_id)
+        .where(PeriodExp.period == period, PeriodExp.period_start == start, PeriodExp.exp_earned > 0)
+    )
+
+
+async def load_period_top(db: AsyncSession, period: str, start: date, limit: int = 10) -> List[Row]:
+    """The first `limit` rows of a period's board; rank is position + 1"""
+    result = await db.execute(
+        _period_query(period, start)
+        .order_by(PeriodExp.exp_earned.desc(), PeriodExp.user_id.asc())
+        .limit(limit)
+    )
+    return list(result.all())
+
+
+async def load_period_rank(db: AsyncSession, period: str, start: date, user_id: int) -> Optional[Tuple[int, Row]]:
+    """(rank, row) for one user, or None if they earned no EXP in the period"""
+    result = await db.execute(_period_query(period, start).where(PeriodExp.user_id == user_id))
+    row = result.one_or_none()
+    if row is None:
+        return None
+
+    def count(*criteria):
+        return (
+            select(func.count()).select_from(PeriodExp)
+            .where(PeriodExp.period == period, PeriodExp.period_start == start, *criteria)
+            .scalar_subquery()
+        )
+
+    ahead = await db.scalar(select(
+        count(PeriodExp.exp_earned > row.exp_earned)
+        + count(PeriodExp.exp_earned == row.exp_earned, PeriodExp.user_id < user_id)
+    ))
+    return ahead + 1, row
+
+
+async def compact_periods(today: Optional[date] = None) -> int:
+    """Delete periods past retention and empty rows of closed periods; returns rows removed"""
+    today = today or datetime.utcnow().date()
+    conditions = []
+    for period in PERIODS:
+        conditions.append(and_(PeriodExp.period == period, PeriodExp.period_start < oldest_retained(period, today)))
+        conditions.append(and_(
+            PeriodExp.period == period,
+            PeriodExp.period_start < period_start(period, today),
+            PeriodExp.exp_earned <= 0
+        ))
+
+    async with SessionLocal() as db:
+        result = await db.execute(delete(PeriodExp).where(or_(*conditions)))
+        await db.commit()
+    return result.rowcount
+
+
+class PeriodCompactor:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.rows_removed = 0
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                self.rows_removed += await compact_periods()
+                self.runs += 1
+            except Exception as e:
+                print(f"ERROR: Period leaderboard compaction failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+period_compactor = PeriodCompactor(
+    interval=float(os.getenv("PERIOD_COMPACT_INTERVAL_SECONDS", "3600")),
+)
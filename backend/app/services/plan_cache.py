@@ -0,0 +1,216 @@
+"""
+Cache of AI-generated plans keyed by a normalized UserProfile
+
+Most profiles fall into a small number of combinations once they are normalized:
+age, weight and height are bucketed, equipment is lower-cased, de-duplicated and
+sorted, and fields the prompt never uses (injuries, preferences) are dropped.
+Profiles with the same key would get the same prompt, so they share plans.
+
+Each key keeps up to PROFILE_CACHE_VARIANTS different AI plans. Until a key has
+that many, requests still go to the models and each new plan is added as another
+variant. After that, requests rotate through the cached variants. Every hit is
+returned as a new plan with a fresh id, the requester's own profile and today's
+date. Variants expire PROFILE_CACHE_TTL_SECONDS after they were generated.
+
+PROFILE_CACHE selects the tiers:
+    tiered   (default) in-memory LRU of PROFILE_CACHE_SIZE keys in front of the
+             plan_cache_entries table, which survives restarts and is shared by workers
+    memory   in-memory tier only
+    off      no caching
+"""
+import hashlib
+import json
+import os
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from app.cache import TTLCache
+from app.database import SessionLocal
+from app.models.db_models import PlanCacheEntry
+from app.models.user import UserProfile
+from app.models.workout import WorkoutPlan
+
+AGE_BUCKET_YEARS = 10
+WEIGHT_BUCKET_KG = 10
+HEIGHT_BUCKET_CM = 10
+
+#How long the memory tier trusts a key that is still collecting variants; other
+#workers may add some to the database in the meantime
+FILLING_TTL_SECONDS = 60
+
+#Per-request fields that are not part of a cached variant
+REQUEST_FIELDS = ("id", "user_profile", "generated_date")
+
+
+def normalize_profile(profile: UserProfile) -> dict:
+    """The parts of a profile that shape the prompt, bucketed"""
+    return {
+        "age": profile.age // AGE_BUCKET_YEARS * AGE_BUCKET_YEARS,
+        "weight": int(profile.weight // WEIGHT_BUCKET_KG * WEIGHT_BUCKET_KG),
+        "height": int(profile.height // HEIGHT_BUCKET_CM * HEIGHT_BUCKET_CM),
+        "fitness_level": profile.fitness_level.value,
+        "goal": profile.goal.value,
+        "available_equipment": sorted({item.strip().lower() for item in profile.available_equipment if item.strip()}),
+        "workout_duration": profile.workout_duration,
+        "days_per_week": profile.days_per_week,
+    }
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def profile_key(profile: UserProfile) -> str:
+    return _digest(normalize_profile(profile))
+
+
+class PlanCache:
+    def __init__(self, kind: str, maxsize: int, ttl: float, variants: int):
+        self.enabled = kind != "off" and variants > 0
+        self.use_database = kind == "tiered"
+        self.ttl = ttl
+        self.variants = variants
+        #profile key -> [(created_at epoch, variant hash, plan content)], oldest first
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        #profile key -> number of plans served from it, to rotate through the variants
+        self._rotation = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        #Lookups of keys with no variants yet, and of keys that still collect more
+        self.misses = 0
+        self.filling = 0
+        self.served_on_failure = 0
+        self.stored = 0
+
+    def _live(self, entries: List[tuple]) -> List[tuple]:
+        cutoff = time.time() - self.ttl
+        return [entry for entry in entries if entry[0] > cutoff]
+
+    async def _load(self, key: str) -> List[tuple]:
+        entries = self.memory.get(key)
+        if entries is None:
+            entries = []
+            if self.use_database:
+                cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+                async with SessionLocal() as db:
+                    rows = await db.scalars(
+                        select(PlanCacheEntry)
+                        .where(PlanCacheEntry.profile_key == key, PlanCacheEntry.created_at > cutoff)
+                        .order_by(PlanCacheEntry.created_at)
+                        .limit(self.variants)
+                    )
+                    entries = [(row.created_at.replace(tzinfo=timezone.utc).timestamp(), row.variant, row.plan) for row in rows]
+            self._remember(key, entries)
+        return self._live(entries)
+
+    def _remember(self, key: str, entries: List[tuple]) -> None:
+        if len(entries) < self.variants:
+            self.memory.set(key, entries, ttl=FILLING_TTL_SECONDS)
+        else:
+            #Until the oldest variant expires and the key needs a new one
+            self.memory.set(key, entries, ttl=entries[0][0] + self.ttl - time.time())
+
+    async def lookup(self, profile: UserProfile) -> Optional[WorkoutPlan]:
+        """A cached plan once the profile's key has all its variants; None while it is filling"""
+        if not self.enabled:
+            return None
+        key = profile_key(profile)
+        entries = await self._load(key)
+        if len(entries) < self.variants:
+            if entries:
+                self.filling += 1
+            else:
+                self.misses += 1
+            return None
+        self.hits += 1
+        return self._serve(key, entries, profile)
+
+    async def any_variant(self, profile: UserProfile) -> Optional[WorkoutPlan]:
+        """Any cached plan for the profile, for when no model could generate one"""
+        if not self.enabled:
+            return None
+        key = profile_key(profile)
+        entries = await self._load(key)
+        if not entries:
+            return None
+        self.served_on_failure += 1
+        return self._serve(key, entries, profile)
+
+    def _serve(self, key: str, entries: List[tuple], profile: UserProfile) -> WorkoutPlan:
+        """The next variant in rotation, as a new plan for this requester"""
+        turn = self._rotation.get(key, 0)
+        self._rotation.set(key, turn + 1)
+        _, _, content = entries[turn % len(entries)]
+        return WorkoutPlan.model_validate({
+            **content,
+            "id": str(uuid.uuid4()),
+            "user_profile": profile,
+            "generated_date": date.today(),
+        })
+
+    async def add(self, profile: UserProfile, plan: WorkoutPlan) -> None:
+        """Keep an AI-generated plan as a variant for its profile key"""
+        if not self.enabled:
+            return
+        key = profile_key(profile)
+        content = plan.model_dump(mode="json", exclude=set(REQUEST_FIELDS))
+        variant = _digest(content)
+        entries = await self._load(key)
+        if len(entries) >= self.variants or any(entry[1] == variant for entry in entries):
+            return
+
+        created_at = datetime.utcnow()
+        self._remember(key, entries + [(created_at.replace(tzinfo=timezone.utc).timestamp(), variant, content)])
+        self.stored += 1
+        if self.use_database:
+            async with SessionLocal() as db:
+                #Expired variants of this key make room; other keys are purged by the maintenance task
+                await db.execute(delete(PlanCacheEntry).where(
+                    PlanCacheEntry.profile_key == key,
+                    PlanCacheEntry.created_at <= created_at - timedelta(seconds=self.ttl)
+                ))
+                try:
+                    async with db.begin_nested():
+                        await db.execute(insert(PlanCacheEntry).values(
+                            profile_key=key, variant=variant, plan=content, created_at=created_at
+                        ))
+                except IntegrityError:
+                    #Another worker cached the same plan first
+                    pass
+                await db.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.filling
+        return {
+            "enabled": self.enabled,
+            "tiers": ("memory", "database") if self.use_database else ("memory",),
+            "variants": self.variants,
+            "hits": self.hits,
+            "misses": self.misses,
+            "filling": self.filling,
+            "served_on_failure": self.served_on_failure,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "stored": self.stored,
+            "memory": self.memory.stats(),
+        }
+
+    async def purge(self) -> int:
+        """Delete expired variants of every key from the database; returns the number removed"""
+        async with SessionLocal() as db:
+            result = await db.execute(delete(PlanCacheEntry).where(
+                PlanCacheEntry.created_at <= datetime.utcnow() - timedelta(seconds=self.ttl)
+            ))
+            await db.commit()
+        return result.rowcount
+
+
+plan_cache = PlanCache(
+    kind=os.getenv("PROFILE_CACHE", "tiered").lower(),
+    maxsize=int(os.getenv("PROFILE_CACHE_SIZE", "500")),
+    ttl=float(os.getenv("PROFILE_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+    variants=int(os.getenv("PROFILE_CACHE_VARIANTS", "3")),
+)
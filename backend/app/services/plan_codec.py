@@ -0,0 +1,96 @@
+"""
+Compact binary encoding for stored workout plans
+
+A packed plan is a small uncompressed frame table followed by zstd-compressed
+msgpack frames: frame 0 holds everything except weekly_schedule, and every day of
+weekly_schedule gets its own frame. Reading one day therefore decompresses only
+that day's frame.
+
+    b"FQP1" | uint16 frame count | (uint32 length, int32 day) per frame | frames
+
+The high bit of the frame count is set when the plan has a weekly_schedule list.
+A day whose "day" does not fit in int32 is recorded as _UNINDEXED and found by
+decoding its frame.
+"""
+import struct
+from typing import List, Optional
+
+import msgpack
+import zstandard
+
+MAGIC = b"FQP1"
+_COUNT = struct.Struct(">H")
+_ENTRY = struct.Struct(">Ii")
+#Day number recorded for frame 0 (the rest of the plan)
+_NO_DAY = -1
+#Day number recorded for days whose "day" is outside int32 (plan_data is client-supplied)
+_UNINDEXED = -2
+_INT32 = range(-2 ** 31, 2 ** 31)
+
+_compressor = zstandard.ZstdCompressor(level=9)
+_decompressor = zstandard.ZstdDecompressor()
+
+
+def _frame(value) -> bytes:
+    return _compressor.compress(msgpack.packb(value, use_bin_type=True))
+
+
+def _unframe(frame: bytes):
+    return msgpack.unpackb(_decompressor.decompress(frame), raw=False)
+
+
+def pack(plan_data: dict) -> bytes:
+    days = plan_data.get("weekly_schedule")
+    if not isinstance(days, list):
+        days = None
+    rest = {key: value for key, value in plan_data.items() if key != "weekly_schedule" or days is None}
+
+    frames = [_frame(rest)]
+    numbers = [_NO_DAY]
+    for position, day in enumerate(days or [], start=1):
+        frames.append(_frame(day))
+        number = day.get("day") if isinstance(day, dict) else None
+        if not isinstance(number, int):
+            number = position
+        numbers.append(number if number in _INT32 else _UNINDEXED)
+
+    table = b"".join(_ENTRY.pack(len(frame), number) for frame, number in zip(frames, numbers))
+    #A plan with weekly_schedule: [] still round-trips to an empty list
+    header = MAGIC + _COUNT.pack(len(frames) if days is None else len(frames) | 0x8000) + table
+    return header + b"".join(frames)
+
+
+def _read_table(blob: bytes):
+    if blob[:4] != MAGIC:
+        raise ValueError("Not a packed plan")
+    count, = _COUNT.unpack_from(blob, 4)
+    has_schedule = bool(count & 0x8000)
+    count &= 0x7FFF
+    entries: List[tuple] = []
+    offset = 6 + count * _ENTRY.size
+    for i in range(count):
+        length, number = _ENTRY.unpack_from(blob, 6 + i * _ENTRY.size)
+        entries.append((offset, length, number))
+        offset += length
+    return has_schedule, entries
+
+
+def unpack(blob: bytes) -> dict:
+    has_schedule, entries = _read_table(blob)
+    plan = _unframe(blob[entries[0][0]:entries[0][0] + entries[0][1]])
+    if has_schedule:
+        plan["weekly_schedule"] = [_unframe(blob[offset:offset + length]) for offset, length, _ in entries[1:]]
+    return plan
+
+
+def unpack_day(blob: bytes, day: int) -> Optional[dict]:
+    """The weekly_schedule entry for `day` (its "day" field), decoding only that frame"""
+    _, entries = _read_table(blob)
+    for offset, length, number in entries[1:]:
+        if number == day and number != _UNINDEXED:
+            return _unframe(blob[offset:offset + length])
+        if number == _UNINDEXED:
+            entry = _unframe(blob[offset:offset + length])
+            if isinstance(entry, dict) and entry.get("day") == day:
+                return entry
+    return None
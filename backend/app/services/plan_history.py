@@ -0,0 +1,152 @@
+"""
+Versioned workout plan history
+
+Saving a plan appends a workout_plan_versions row and moves users.current_workout_id
+to it. The plan itself lives in plan_contents under the sha256 of its canonical JSON,
+so identical plans (a re-save, or the same plan for many users) are stored once.
+Saving the plan that is already current writes nothing.
+
+Contents are stored packed (app.services.plan_codec) unless PLAN_STORAGE=jsonb and
+the database is Postgres, in which case they are JSONB and single days are
+projected by the database. Either way /workouts/current/days/{n} decodes one day.
+"""
+import hashlib
+import json
+import os
+from typing import List, Optional, Tuple
+
+from sqlalchemy import cast, func, insert, literal, null, select, update
+from sqlalchemy.dialects.postgresql import JSONB, JSONPATH
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.db_models import PlanContent, User, WorkoutPlanVersion
+from app.services.plan_codec import pack, unpack, unpack_day
+
+PLAN_STORAGE = os.getenv("PLAN_STORAGE", "packed").lower()
+
+#weekly_schedule entry whose "day" equals the $day variable
+DAY_PATH = "$.weekly_schedule[*] ? (@.day == $day)"
+
+
+def plan_content_hash(plan_data: dict) -> str:
+    canonical = json.dumps(plan_data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def uses_jsonb(db: AsyncSession) -> bool:
+    return PLAN_STORAGE == "jsonb" and db.bind.dialect.name == "postgresql"
+
+
+def content_values(db: AsyncSession, plan_data: dict) -> dict:
+    """plan_contents columns for plan_data in the configured storage format"""
+    if uses_jsonb(db):
+        return {"packed": null(), "plan_data": plan_data}
+    return {"packed": pack(plan_data), "plan_data": null()}
+
+
+def decode_content(packed: Optional[bytes], plan_data: Optional[dict]) -> dict:
+    return unpack(packed) if packed is not None else plan_data
+
+
+async def store_content(db: AsyncSession, content_hash: str, plan_data: dict) -> None:
+    """Insert the plan into plan_contents unless it is already there"""
+    if await db.scalar(select(PlanContent.content_hash).where(PlanContent.content_hash == content_hash)) is None:
+        try:
+            async with db.begin_nested():
+                await db.execute(insert(PlanContent).values(content_hash=content_hash, **content_values(db, plan_data)))
+        except IntegrityError:
+            #Another request stored the same plan first
+            pass
+
+
+async def load_current_id(db: AsyncSession, user_id: int) -> Optional[int]:
+    """Id of the user's current version, without touching its content"""
+    return await db.scalar(select(User.current_workout_id).where(User.id == user_id))
+
+
+async def load_current(db: AsyncSession, user_id: int) -> Optional[Tuple[WorkoutPlanVersion, dict]]:
+    """(version, plan_data) the user's pointer refers to, or None"""
+    result = await db.execute(
+        select(WorkoutPlanVersion, PlanContent.packed, PlanContent.plan_data)
+        .join(User, User.current_workout_id == WorkoutPlanVersion.id)
+        .join(PlanContent, PlanContent.content_hash == WorkoutPlanVersion.content_hash)
+        .where(User.id == user_id)
+    )
+    row = result.one_or_none()
+    return (row[0], decode_content(row[1], row[2])) if row is not None else None
+
+
+async def load_current_day(db: AsyncSession, user_id: int, day: int) -> Optional[Tuple[WorkoutPlanVersion, Optional[dict]]]:
+    """(version, the weekly_schedule entry for `day` or None) of the current plan, or None
+
+    Only that day is decoded: one frame of a packed plan, or a JSONB path query
+    with PLAN_STORAGE=jsonb.
+    """
+    jsonb = uses_jsonb(db)
+    if jsonb:
+        #Postgres has no implicit cast to jsonpath, so the bound path is cast explicitly
+        projected = func.jsonb_path_query_first(
+            cast(PlanContent.plan_data, JSONB),
+            cast(literal(DAY_PATH), JSONPATH),
+            func.jsonb_build_object("day", day)
+        )
+    else:
+        projected = PlanContent.plan_data
+    result = await db.execute(
+        select(WorkoutPlanVersion, PlanContent.packed, projected)
+        .join(User, User.current_workout_id == WorkoutPlanVersion.id)
+        .join(PlanContent, PlanContent.content_hash == WorkoutPlanVersion.content_hash)
+        .where(User.id == user_id)
+    )
+    row = result.one_or_none()
+    if row is None:
+        return None
+
+    version, packed, value = row
+    if packed is not None:
+        return version, unpack_day(packed, day)
+    if jsonb:
+        return version, value
+    return version, next(
+        (entry for entry in (value or {}).get("weekly_schedule") or [] if isinstance(entry, dict) and entry.get("day") == day),
+        None
+    )
+
+
+async def save_version(db: AsyncSession, user_id: int, plan_data: dict, week_number: int) -> Tuple[WorkoutPlanVersion, bool]:
+    """Make plan_data the user's current plan; returns (version, created)
+
+    Nothing is written when the current version already has this content and week.
+    """
+    content_hash = plan_content_hash(plan_data)
+    current = await db.scalar(
+        select(WorkoutPlanVersion)
+        .join(User, User.current_workout_id == WorkoutPlanVersion.id)
+        .where(User.id == user_id)
+    )
+    if current is not None and current.content_hash == content_hash and current.week_number == week_number:
+        return current, False
+
+    await store_content(db, content_hash, plan_data)
+    version = WorkoutPlanVersion(user_id=user_id, content_hash=content_hash, week_number=week_number)
+    db.add(version)
+    await db.flush()
+    await db.execute(update(User).where(User.id == user_id).values(current_workout_id=version.id))
+    return version, True
+
+
+async def clear_current(db: AsyncSession, user_id: int) -> None:
+    """Unset the user's current plan; its versions stay in the history"""
+    await db.execute(update(User).where(User.id == user_id).values(current_workout_id=None))
+
+
+async def load_history(db: AsyncSession, user_id: int, limit: int) -> List[WorkoutPlanVersion]:
+    """The user's versions, newest first (an index range on (user_id, created_at))"""
+    result = await db.scalars(
+        select(WorkoutPlanVersion)
+        .where(WorkoutPlanVersion.user_id == user_id)
+        .order_by(WorkoutPlanVersion.created_at.desc(), WorkoutPlanVersion.id.desc())
+        .limit(limit)
+    )
+    return list(result)
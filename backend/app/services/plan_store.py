@@ -0,0 +1,99 @@
+"""
+Storage for plans returned by /generate-workout
+
+PLAN_STORE selects the implementation:
+    tiered   (default) bounded in-memory LRU/TTL cache in front of the database
+    database every read and write goes to the generated_plans table
+    memory   cache only; plans are lost on restart and not shared between workers
+
+The memory tier holds at most PLAN_CACHE_SIZE plans for PLAN_CACHE_TTL_SECONDS, so a
+worker's memory stays bounded however many plans it generates.
+"""
+import os
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import TTLCache
+from app.models.db_models import GeneratedPlan
+from app.models.workout import WorkoutPlan
+
+
+class PlanStore(ABC):
+    """Interface: plans are looked up by their id"""
+
+    @abstractmethod
+    async def get(self, db: AsyncSession, plan_id: str) -> Optional[WorkoutPlan]:
+        ...
+
+    @abstractmethod
+    async def put(self, db: AsyncSession, plan: WorkoutPlan, user_id: Optional[int] = None) -> None:
+        ...
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemoryPlanStore(PlanStore):
+    def __init__(self, maxsize: int, ttl: float):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, db: AsyncSession, plan_id: str) -> Optional[WorkoutPlan]:
+        return self.cache.get(plan_id)
+
+    async def put(self, db: AsyncSession, plan: WorkoutPlan, user_id: Optional[int] = None) -> None:
+        self.cache.set(plan.id, plan)
+
+    def stats(self) -> dict:
+        return {"memory": self.cache.stats()}
+
+
+class DatabasePlanStore(PlanStore):
+    async def get(self, db: AsyncSession, plan_id: str) -> Optional[WorkoutPlan]:
+        row = await db.get(GeneratedPlan, plan_id)
+        return WorkoutPlan.model_validate(row.plan) if row is not None else None
+
+    async def put(self, db: AsyncSession, plan: WorkoutPlan, user_id: Optional[int] = None) -> None:
+        db.add(GeneratedPlan(id=plan.id, user_id=user_id, plan=plan.model_dump(mode="json")))
+        await db.commit()
+
+
+class TieredPlanStore(PlanStore):
+    """Read-through / write-through: memory first, then the backing store"""
+
+    def __init__(self, memory: MemoryPlanStore, backing: PlanStore):
+        self.memory = memory
+        self.backing = backing
+
+    async def get(self, db: AsyncSession, plan_id: str) -> Optional[WorkoutPlan]:
+        plan = await self.memory.get(db, plan_id)
+        if plan is None:
+            plan = await self.backing.get(db, plan_id)
+            if plan is not None:
+                await self.memory.put(db, plan)
+        return plan
+
+    async def put(self, db: AsyncSession, plan: WorkoutPlan, user_id: Optional[int] = None) -> None:
+        await self.backing.put(db, plan, user_id)
+        await self.memory.put(db, plan)
+
+    def stats(self) -> dict:
+        return self.memory.stats()
+
+
+def create_plan_store(kind: str, maxsize: int, ttl: float) -> PlanStore:
+    if kind == "memory":
+        return MemoryPlanStore(maxsize, ttl)
+    if kind == "database":
+        return DatabasePlanStore()
+    if kind == "tiered":
+        return TieredPlanStore(MemoryPlanStore(maxsize, ttl), DatabasePlanStore())
+    raise ValueError(f"Unknown PLAN_STORE {kind!r}, expected tiered, database or memory")
+
+
+plan_store = create_plan_store(
+    os.getenv("PLAN_STORE", "tiered").lower(),
+    maxsize=int(os.getenv("PLAN_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("PLAN_CACHE_TTL_SECONDS", "3600")),
+)
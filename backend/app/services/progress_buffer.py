@@ -0,0 +1,159 @@
+"""
+Optional write-behind buffer for PUT /progress/
+
+With PROGRESS_WRITE_BEHIND enabled, progress updates are merged per user in memory
+and written in batched UPDATEs every PROGRESS_FLUSH_INTERVAL_MS, as soon as
+PROGRESS_FLUSH_MAX_PENDING users are waiting, and on shutdown. Reads served by the
+same worker overlay the pending state, so clients always see their latest write.
+Writes with If-Match take the user's pending state and go straight to the database,
+where the check is a compare-and-set on the row.
+"""
+import asyncio
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import bindparam, select
+
+from app.database import SessionLocal
+from app.models.db_models import UserProgress
+from app.services.completions import record_progress_save
+from app.services.progression import total_exp
+from app.services.progress_hooks import progress_written
+
+
+class ProgressWriteBuffer:
+    def __init__(self, enabled: bool, interval: float, max_pending: int):
+        self.enabled = enabled
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending: Dict[int, dict] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        #Flush started by put() when max_pending is reached; kept so it is not garbage-collected
+        self._early_flush: Optional[asyncio.Task] = None
+        self.updates = 0
+        self.flushes = 0
+        self.rows_written = 0
+
+    def get(self, user_id: int) -> Optional[dict]:
+        """Pending (not yet written) progress fields for a user"""
+        pending = self._pending.get(user_id)
+        return dict(pending) if pending else None
+
+    def put(self, user_id: int, changes: dict) -> None:
+        """Merge changes into the user's pending state; later values win"""
+        self._pending.setdefault(user_id, {}).update(changes)
+        self.updates += 1
+        if len(self._pending) >= self.max_pending and self._early_flush is None:
+            self._early_flush = asyncio.get_running_loop().create_task(self.flush())
+            self._early_flush.add_done_callback(self._early_flush_done)
+
+    def _early_flush_done(self, task: asyncio.Task) -> None:
+        self._early_flush = None
+        #A failed flush has already put its batch back; the next one retries it
+        if not task.cancelled() and task.exception() is not None:
+            print(f"ERROR: Progress write-behind flush failed: {task.exception()}")
+
+    def take(self, user_id: int) -> Optional[dict]:
+        """Remove and return a user's pending state, for a write that goes straight to the database"""
+        return self._pending.pop(user_id, None)
+
+    def restore(self, user_id: int, changes: Optional[dict]) -> None:
+        """Put taken state back underneath anything buffered since"""
+        if changes:
+            self._pending[user_id] = {**changes, **self._pending.get(user_id, {})}
+
+    async def flush(self, user_ids: Optional[Iterable[int]] = None) -> None:
+        """Write pending state (for all users, or just user_ids) in one transaction"""
+        async with self._flush_lock:
+            if user_ids is None:
+                batch, self._pending = self._pending, {}
+            else:
+                batch = {uid: self._pending.pop(uid) for uid in user_ids if uid in self._pending}
+            if not batch:
+                return
+
+            try:
+                async with SessionLocal() as db:
+                    await _write_progress(db, batch)
+                    await db.commit()
+            except Exception:
+                #Put the batch back underneath anything written since, then let the caller see the error
+                for uid, changes in batch.items():
+                    self.restore(uid, changes)
+                raise
+
+            for uid, changes in batch.items():
+                progress_written(uid, {field: value for field, value in changes.items() if field != "completed_exercises"})
+            self.flushes += 1
+            self.rows_written += len(batch)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"ERROR: Progress write-behind flush failed: {e}")
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._early_flush is not None:
+            await asyncio.gather(self._early_flush, return_exceptions=True)
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "pending_users": len(self._pending),
+            "updates": self.updates,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+        }
+
+
+async def _write_progress(db, batch: Dict[int, dict]) -> None:
+    """Batched UPDATEs: one executemany per distinct set of changed columns
+
+    The EXP each user gained since the stored row is booked like a direct PUT.
+    """
+    table = UserProgress.__table__
+    result = await db.execute(
+        select(UserProgress.user_id, UserProgress.level, UserProgress.current_exp)
+        .where(UserProgress.user_id.in_(list(batch)))
+    )
+    stored = {user_id: (level, current_exp) for user_id, level, current_exp in result.all()}
+    groups = defaultdict(list)
+    for user_id, changes in batch.items():
+        columns = tuple(sorted(field for field in changes if field != "completed_exercises"))
+        if columns:
+            groups[columns].append({"b_user_id": user_id, **{f"b_{c}": changes[c] for c in columns}})
+
+    for columns, rows in groups.items():
+        statement = (
+            table.update()
+            .where(table.c.user_id == bindparam("b_user_id"))
+            .values({column: bindparam(f"b_{column}") for column in columns})
+        )
+        await db.execute(statement, rows)
+
+    for user_id, changes in batch.items():
+        exp_delta = 0
+        if user_id in stored:
+            level, current_exp = stored[user_id]
+            exp_delta = total_exp(changes.get("level", level), changes.get("current_exp", current_exp)) - total_exp(level, current_exp)
+        await record_progress_save(db, user_id, changes.get("completed_exercises"), exp_delta)
+
+
+progress_buffer = ProgressWriteBuffer(
+    enabled=os.getenv("PROGRESS_WRITE_BEHIND", "false").lower() in ("1", "true", "yes"),
+    interval=float(os.getenv("PROGRESS_FLUSH_INTERVAL_MS", "500")) / 1000,
+    max_pending=int(os.getenv("PROGRESS_FLUSH_MAX_PENDING", "200")),
+)
@@ -0,0 +1,23 @@
+"""
+Propagation of committed progress writes to in-memory state
+
+Every route (and the write-behind flush) calls progress_written() after its commit,
+so the rank index, the leaderboard snapshot and live streams stay in step.
+"""
+from typing import Optional
+
+from app.services.broadcaster import broadcaster
+from app.services.leaderboard_snapshot import leaderboard_snapshot
+from app.services.rank_index import rank_index
+
+RANKED_FIELDS = ("level", "current_exp", "total_exercises_completed")
+
+
+def progress_written(user_id: int, changes: dict, username: Optional[str] = None) -> None:
+    """`changes` holds the progress fields that changed; pass `username` for a new progress row"""
+    if username is not None:
+        rank_index.upsert(user_id, changes["level"], changes["current_exp"], changes["total_exercises_completed"], username)
+    else:
+        rank_index.apply(user_id, **{field: changes[field] for field in RANKED_FIELDS if field in changes})
+    leaderboard_snapshot.note_write()
+    broadcaster.publish_progress(user_id, changes)
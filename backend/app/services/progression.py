@@ -0,0 +1,96 @@
+"""
+Authoritative gamification rules (mirrors frontend/src/utils/progressSystem.js)
+
+Progress is stored as (level, current_exp), which is equivalent to a single lifetime
+EXP total. Converting a total back to a level uses the closed-form inverse of the
+geometric EXP curve instead of walking level by level, and the same conversion is
+available over numpy arrays for recomputing many users at once.
+"""
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+BASE_EXP = 100
+GROWTH = 1.5
+
+#exp_for_level() overflows int64 a little past level 100; nobody gets near this
+MAX_LEVEL = 90
+
+
+def exp_for_level(level: int) -> int:
+    """EXP needed to go from `level` to `level + 1`"""
+    return int(BASE_EXP * GROWTH ** (level - 1))
+
+
+#_CUMULATIVE_EXP[level] = lifetime EXP needed to reach `level` (index 0 is unused)
+_CUMULATIVE_EXP = [0, 0]
+for _level in range(2, MAX_LEVEL + 2):
+    _CUMULATIVE_EXP.append(_CUMULATIVE_EXP[-1] + exp_for_level(_level - 1))
+
+_CUMULATIVE_ARRAY = np.array(_CUMULATIVE_EXP, dtype=np.int64)
+_EXP_FOR_LEVEL_ARRAY = np.array([0] + [exp_for_level(level) for level in range(1, MAX_LEVEL + 2)], dtype=np.int64)
+_LOG_GROWTH = math.log(GROWTH)
+#Without the floor() in exp_for_level, reaching level L takes BASE_EXP * (GROWTH^(L-1) - 1) / (GROWTH - 1)
+_GEOMETRIC_SCALE = BASE_EXP / (GROWTH - 1)
+
+
+def exp_gain(exercise_type: str, sets: Optional[int] = None) -> int:
+    """EXP awarded for completing one exercise"""
+    base_exp = {"strength": 15, "cardio": 12, "core": 13}.get(str(getattr(exercise_type, "value", exercise_type)), 10)
+
+    #Bonus EXP for multiple sets
+    if sets and sets > 1:
+        base_exp += sets * 2
+
+    return base_exp
+
+
+def total_exp(level: int, current_exp: int) -> int:
+    """Lifetime EXP represented by a (level, current_exp) pair"""
+    level = min(max(level, 1), MAX_LEVEL)
+    return _CUMULATIVE_EXP[level] + current_exp
+
+
+def level_from_total_exp(total: int) -> Tuple[int, int, int]:
+    """Return (level, current_exp, exp_to_next_level) for a lifetime EXP total"""
+    total = max(total, 0)
+    level = int(1 + math.log(total / _GEOMETRIC_SCALE + 1) / _LOG_GROWTH)
+    level = min(max(level, 1), MAX_LEVEL)
+
+    #floor() makes real thresholds slightly lower than the geometric estimate, and
+    #float rounding can land either side of an exact boundary: one step fixes both
+    if level < MAX_LEVEL and _CUMULATIVE_EXP[level + 1] <= total:
+        level += 1
+    elif level > 1 and _CUMULATIVE_EXP[level] > total:
+        level -= 1
+
+    return level, total - _CUMULATIVE_EXP[level], exp_for_level(level)
+
+
+def apply_exp(level: int, current_exp: int, exp_delta: int) -> Tuple[int, int, int]:
+    """Add (or remove) EXP and return the new (level, current_exp, exp_to_next_level)
+
+    Gains roll over into as many level-ups as they cover; losses roll back into
+    earlier levels and stop at level 1 with 0 EXP.
+    """
+    return level_from_total_exp(total_exp(level, current_exp) + exp_delta)
+
+
+def levels_from_total_exp_array(totals: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Vectorized level_from_total_exp: arrays of (level, current_exp, exp_to_next_level)"""
+    totals = np.maximum(np.asarray(totals, dtype=np.int64), 0)
+    levels = (1 + np.log(totals / _GEOMETRIC_SCALE + 1) / _LOG_GROWTH).astype(np.int64)
+    np.clip(levels, 1, MAX_LEVEL, out=levels)
+
+    levels += (levels < MAX_LEVEL) & (_CUMULATIVE_ARRAY[levels + 1] <= totals)
+    levels -= (levels > 1) & (_CUMULATIVE_ARRAY[levels] > totals)
+
+    return levels, totals - _CUMULATIVE_ARRAY[levels], _EXP_FOR_LEVEL_ARRAY[levels]
+
+
+def recompute_progress_array(levels: np.ndarray, current_exps: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Normalize stored (level, current_exp) pairs for many users at once"""
+    levels = np.clip(np.asarray(levels, dtype=np.int64), 1, MAX_LEVEL)
+    totals = _CUMULATIVE_ARRAY[levels] + np.asarray(current_exps, dtype=np.int64)
+    return levels_from_total_exp_array(totals)
@@ -0,0 +1,304 @@
+"""
+In-process leaderboard rank index
+
+Users are kept in leaderboard order (level DESC, current_exp DESC, user_id ASC)
+across a fixed set of buckets: SUB_BUCKETS slices of each level's EXP range. A
+Fenwick tree holds the number of users per bucket, and each bucket keeps its users
+in a small sorted list. A rank is a Fenwick prefix sum plus a bisect inside one
+bucket, and a page of N users starting at any rank is a Fenwick descent plus a
+walk over the next non-empty buckets, so none of them touches the database.
+
+The index is warmed from user_progress at startup, updated by the progress routes
+after every commit, caught up from user_progress.updated_at so writes made by other
+workers show up, and periodically checked against the database (and rebuilt if it
+has drifted).
+"""
+import asyncio
+import bisect
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.models.db_models import User, UserProgress
+from app.services.leaderboard import load_top, load_user_rank
+from app.services.progression import MAX_LEVEL, exp_for_level
+
+SUB_BUCKETS = 64
+#How far back each catch-up re-reads, to cover transactions that committed late
+CATCH_UP_OVERLAP = timedelta(seconds=5)
+
+
+class FenwickTree:
+    def __init__(self, size: int):
+        self.size = size
+        self._tree = [0] * (size + 1)
+
+    @classmethod
+    def from_counts(cls, counts: List[int]) -> "FenwickTree":
+        """Build in O(n) from per-position counts"""
+        tree = cls(len(counts))
+        for i, count in enumerate(counts, start=1):
+            tree._tree[i] += count
+            parent = i + (i & -i)
+            if parent <= tree.size:
+                tree._tree[parent] += tree._tree[i]
+        return tree
+
+    def add(self, index: int, delta: int) -> None:
+        i = index + 1
+        while i <= self.size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix(self, index: int) -> int:
+        """Sum of positions 0..index-1"""
+        total = 0
+        i = index
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, k: int) -> Tuple[int, int]:
+        """(position, offset) of the k-th item (0-based); position == size when k is past the end"""
+        position = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            following = position + step
+            if following <= self.size and self._tree[following] <= k:
+                position = following
+                k -= self._tree[following]
+            step >>= 1
+        return position, k
+
+
+class Record(NamedTuple):
+    level: int
+    current_exp: int
+    total_exercises_completed: int
+    username: str
+
+
+def _sort_key(user_id: int, level: int, exp: int) -> tuple:
+    return (-level, -exp, user_id)
+
+
+def _bucket(level: int, exp: int) -> int:
+    """Bucket index; 0 holds the best users"""
+    level = min(max(level, 1), MAX_LEVEL)
+    sub = min(max(exp, 0) * SUB_BUCKETS // exp_for_level(level), SUB_BUCKETS - 1)
+    return (MAX_LEVEL - level) * SUB_BUCKETS + (SUB_BUCKETS - 1 - sub)
+
+
+class RankIndex:
+    def __init__(self, enabled: bool, sync_interval: float, check_interval: float):
+        self.enabled = enabled
+        self.sync_interval = sync_interval
+        self.check_interval = check_interval
+        self.ready = False
+        self._records: Dict[int, Record] = {}
+        self._buckets: List[list] = []
+        self._counts = FenwickTree(0)
+        self._synced_until: Optional[datetime] = None
+        self._tasks: List[asyncio.Task] = []
+        self.rebuilds = 0
+        self.last_check_mismatches = 0
+
+    #Building
+
+    def _load(self, rows) -> None:
+        bucket_count = MAX_LEVEL * SUB_BUCKETS
+        buckets = [[] for _ in range(bucket_count)]
+        records = {}
+        for user_id, username, level, exp, total in rows:
+            records[user_id] = Record(level, exp, total, username)
+            buckets[_bucket(level, exp)].append(_sort_key(user_id, level, exp))
+        for bucket in buckets:
+            bucket.sort()
+        self._records = records
+        self._buckets = buckets
+        self._counts = FenwickTree.from_counts([len(bucket) for bucket in buckets])
+
+    async def rebuild(self) -> None:
+        """(Re)load every user from the database"""
+        started = datetime.utcnow()
+        async with SessionLocal() as db:
+            result = await db.execute(
+                select(UserProgress.user_id, User.username, UserProgress.level,
+                       UserProgress.current_exp, UserProgress.total_exercises_completed)
+                .join(User, User.id == UserProgress.user_id)
+            )
+            rows = result.all()
+        self._load(rows)
+        self._synced_until = started
+        self.ready = True
+        self.rebuilds += 1
+
+    #Incremental updates
+
+    def _remove(self, user_id: int) -> None:
+        record = self._records.pop(user_id, None)
+        if record is None:
+            return
+        level, exp = record.level, record.current_exp
+        index = _bucket(level, exp)
+        bucket = self._buckets[index]
+        position = bisect.bisect_left(bucket, _sort_key(user_id, level, exp))
+        if position < len(bucket) and bucket[position][2] == user_id:
+            del bucket[position]
+            self._counts.add(index, -1)
+
+    def upsert(self, user_id: int, level: int, current_exp: int, total_exercises_completed: int, username: str) -> None:
+        if not self.ready:
+            return
+        self._remove(user_id)
+        self._records[user_id] = Record(level, current_exp, total_exercises_completed, username)
+        index = _bucket(level, current_exp)
+        bisect.insort(self._buckets[index], _sort_key(user_id, level, current_exp))
+        self._counts.add(index, 1)
+
+    def apply(self, user_id: int, **changes) -> None:
+        """Merge changed progress fields (level / current_exp / total_exercises_completed) for a known user"""
+        record = self._records.get(user_id)
+        if not self.ready or record is None:
+            return
+        self.upsert(
+            user_id,
+            changes.get("level", record.level),
+            changes.get("current_exp", record.current_exp),
+            changes.get("total_exercises_completed", record.total_exercises_completed),
+            record.username
+        )
+
+    async def catch_up(self) -> int:
+        """Pull rows changed since the last sync (including writes by other workers)"""
+        if not self.ready:
+            return 0
+        started = datetime.utcnow()
+        async with SessionLocal() as db:
+            result = await db.execute(
+                select(UserProgress.user_id, User.username, UserProgress.level,
+                       UserProgress.current_exp, UserProgress.total_exercises_completed)
+                .join(User, User.id == UserProgress.user_id)
+                .where(UserProgress.updated_at >= self._synced_until - CATCH_UP_OVERLAP)
+            )
+            rows = result.all()
+        for user_id, username, level, exp, total in rows:
+            self.upsert(user_id, level, exp, total, username)
+        self._synced_until = started
+        return len(rows)
+
+    #Queries
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def rank(self, user_id: int) -> Optional[Tuple[int, Record]]:
+        """(rank, record) for one user, or None if unknown"""
+        record = self._records.get(user_id)
+        if record is None:
+            return None
+        index = _bucket(record.level, record.current_exp)
+        position = bisect.bisect_left(self._buckets[index], _sort_key(user_id, record.level, record.current_exp))
+        return self._counts.prefix(index) + position + 1, record
+
+    def position(self, level: int, current_exp: int, user_id: int, inclusive: bool = False) -> int:
+        """Number of users ranked before the key (level, current_exp, user_id), plus the key itself if inclusive"""
+        index = _bucket(level, current_exp)
+        search = bisect.bisect_right if inclusive else bisect.bisect_left
+        return self._counts.prefix(index) + search(self._buckets[index], _sort_key(user_id, level, current_exp))
+
+    def slice(self, start: int, limit: int) -> List[Tuple[int, int, Record]]:
+        """Users at 0-based positions start..start+limit-1 as (rank, user_id, record)"""
+        entries = []
+        index, offset = self._counts.find(max(start, 0))
+        while index < len(self._buckets) and len(entries) < limit:
+            for _, _, user_id in self._buckets[index][offset:offset + limit - len(entries)]:
+                entries.append((start + len(entries) + 1, user_id, self._records[user_id]))
+            index, offset = index + 1, 0
+        return entries
+
+    def top(self, limit: int) -> List[Tuple[int, int, Record]]:
+        """First `limit` users as (rank, user_id, record)"""
+        return self.slice(0, limit)
+
+    #Consistency
+
+    async def verify(self, sample: int = 50) -> int:
+        """Compare the top 10 and a random sample of ranks with SQL; returns the mismatch count"""
+        mismatches = 0
+        async with SessionLocal() as db:
+            top_rows = await load_top(db, 10)
+            top = self.top(10)
+            mismatches += sum(1 for (_, user_id, _), row in zip(top, top_rows) if user_id != row.user_id)
+            mismatches += abs(len(top) - len(top_rows))
+
+            user_ids = random.sample(list(self._records), min(sample, len(self._records)))
+            for user_id in user_ids:
+                expected = await load_user_rank(db, user_id)
+                actual = self.rank(user_id)
+                if expected is None or actual is None or expected[0] != actual[0]:
+                    mismatches += 1
+        self.last_check_mismatches = mismatches
+        return mismatches
+
+    #Lifecycle
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.catch_up()
+            except Exception as e:
+                print(f"ERROR: Rank index catch-up failed: {e}")
+
+    async def _check_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.catch_up()
+                if await self.verify():
+                    print(f"WARNING: Rank index drifted ({self.last_check_mismatches} mismatches), rebuilding")
+                    await self.rebuild()
+            except Exception as e:
+                print(f"ERROR: Rank index check failed: {e}")
+
+    async def _warm(self) -> None:
+        try:
+            await self.rebuild()
+            print(f"Rank index warmed with {len(self)} users")
+        except Exception as e:
+            print(f"ERROR: Rank index warm-up failed, leaderboard stays on SQL: {e}")
+            return
+        loop = asyncio.get_running_loop()
+        self._tasks += [loop.create_task(self._sync_loop()), loop.create_task(self._check_loop())]
+
+    def start(self) -> None:
+        """Warm in the background; the leaderboard uses SQL until the index is ready"""
+        if self.enabled and not self._tasks:
+            self._tasks.append(asyncio.get_running_loop().create_task(self._warm()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "users": len(self),
+            "rebuilds": self.rebuilds,
+            "last_check_mismatches": self.last_check_mismatches,
+        }
+
+
+rank_index = RankIndex(
+    enabled=os.getenv("LEADERBOARD_RANK_INDEX", "true").lower() in ("1", "true", "yes"),
+    sync_interval=float(os.getenv("RANK_INDEX_SYNC_SECONDS", "5")),
+    check_interval=float(os.getenv("RANK_INDEX_CHECK_SECONDS", "600")),
+)
@@ -0,0 +1,66 @@
+"""
+Single-flight coalescing of identical concurrent work
+
+Callers that ask for the same key while a call for it is in flight wait for that
+call instead of starting their own, and all of them get its result (or its
+error). AI generation uses it with the normalized profile key from
+app.services.plan_cache, so a burst of similar sign-ups costs one model request.
+
+The shared call runs in its own task. A caller that is cancelled stops waiting
+without cancelling it for the others. With COALESCE_GENERATIONS=false every call
+runs on its own.
+"""
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        #key -> [shared task, number of callers that joined it]
+        self._flights: Dict[Hashable, list] = {}
+        self.calls = 0
+        self.executions = 0
+        self.max_waiters = 0
+
+    async def do(self, key: Hashable, work: Callable[[], Awaitable]) -> Tuple[object, bool]:
+        """(result of work, whether it was shared with an earlier caller)"""
+        self.calls += 1
+        if not self.enabled:
+            self.executions += 1
+            return await work(), False
+
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if not shared:
+            self.executions += 1
+            task = asyncio.ensure_future(work())
+            flight = self._flights[key] = [task, 0]
+            task.add_done_callback(lambda task: self._land(key, task))
+        flight[1] += 1
+        self.max_waiters = max(self.max_waiters, flight[1])
+        return await asyncio.shield(flight[0]), shared
+
+    def _land(self, key: Hashable, task: asyncio.Future) -> None:
+        self._flights.pop(key, None)
+        if not task.cancelled():
+            #Retrieved here too, in case every caller stopped waiting
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._flights),
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.calls - self.executions,
+            #Callers per upstream call; 1.0 means nothing was shared
+            "coalescing_ratio": round(self.calls / self.executions, 3) if self.executions else None,
+            "max_waiters": self.max_waiters,
+        }
+
+
+generation_flights = SingleFlight(
+    enabled=os.getenv("COALESCE_GENERATIONS", "true").lower() in ("1", "true", "yes"),
+)
@@ -0,0 +1,195 @@
+"""
+AI plan generation against a local stub of the chat completions API.
+
+Starts a small keep-alive HTTP/1.1 stub server in a background thread, points the
+generator at it and runs --requests generations, --concurrency at a time, on one
+event loop. Reports latency, how many TCP connections the stub accepted (pooled
+connections are reused), and the worst event-loop stall measured by a 10 ms ticker
+while generations are in flight.
+
+Scenarios:
+    ok          every model answers after --delay seconds
+    slow-first  the first model never answers in time; the read timeout moves on
+    down        nothing listens on the API port; the connect error is immediate
+
+Usage (from backend/):
+    python -m benchmarks.ai_generation_stub --requests 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import socket
+import statistics
+import threading
+import time
+from typing import Callable, Tuple
+
+STUB_CONTENT = json.dumps({"weekly_schedule": [
+    {"day": day, "focus": "Full Body", "total_duration": 40, "exercises": [
+        {"name": "Push-ups", "type": "strength", "sets": 3, "reps": 12, "rest": 60},
+        {"name": "Squats", "type": "strength", "sets": 3, "reps": 15, "rest": 60}
+    ]}
+    for day in (1, 2, 3)
+]}, separators=(",", ":"))
+
+
+class StubServer:
+    """Chat completions stub; respond(model) -> (delay seconds, HTTP status) per request
+
+    Counts connections and requests; cancelled counts requests whose client hung up
+    before the answer was due.
+    """
+
+    def __init__(self, respond: Callable[[str], Tuple[float, int]]):
+        self.respond = respond
+        self.connections = 0
+        self.requests = 0
+        self.cancelled = 0
+        self.port = None
+        self._loop = None
+        self._ready = threading.Event()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    if name.lower() == "content-length":
+                        length = int(value)
+                payload = json.loads(await reader.readexactly(length))
+                self.requests += 1
+                delay, status = self.respond(payload["model"])
+                #A hung-up client shows as EOF while we are still "generating"
+                try:
+                    await asyncio.wait_for(reader.read(1), delay)
+                    self.cancelled += 1
+                    return
+                except asyncio.TimeoutError:
+                    pass
+                if status == 200:
+                    body = json.dumps({"choices": [{"message": {"role": "assistant", "content": STUB_CONTENT}}]}).encode()
+                else:
+                    body = b'{"error":"injected failure"}'
+                writer.write(
+                    f"HTTP/1.1 {status} Stub\r\nContent-Type: application/json\r\n".encode()
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        server = self._loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    def start(self) -> int:
+        threading.Thread(target=self._run, daemon=True).start()
+        self._ready.wait()
+        return self.port
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def loop_lag(stop: asyncio.Event, samples: list) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        samples.append(time.perf_counter() - started - 0.01)
+
+
+async def run(args, scenario: str) -> None:
+    from app.models.user import UserProfile
+    from app.services.ai_workout_generator import AIWorkoutGenerator
+    from app.services.inference_client import inference_client
+
+    generator = AIWorkoutGenerator()
+    inference_client.requests = inference_client.errors = inference_client.timeouts = 0
+    profile = UserProfile(
+        age=30, weight=70, height=175, fitness_level="beginner", goal="maintenance",
+        available_equipment=["dumbbells"], workout_duration=40, days_per_week=3
+    )
+
+    if scenario == "down":
+        stub = None
+        inference_client.api_url = f"http://127.0.0.1:{free_port()}/v1/chat/completions"
+    else:
+        slow = generator.models[0] if scenario == "slow-first" else None
+        stub = StubServer(lambda model: (3600 if model == slow else args.delay, 200))
+        inference_client.api_url = f"http://127.0.0.1:{stub.start()}/v1/chat/completions"
+
+    #As in the app's lifespan: the client (and its TLS context) exists before requests arrive
+    inference_client.start()
+    stop, lag = asyncio.Event(), []
+    ticker = asyncio.create_task(loop_lag(stop, lag))
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            plan = await generator.generate_workout_plan(profile)
+            latencies.append(time.perf_counter() - started)
+            return plan
+
+    started = time.perf_counter()
+    #The generator logs every attempt and the whole plan; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        plans = await asyncio.gather(*(one() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    await inference_client.stop()
+
+    latencies.sort()
+    print(f"\n== {scenario}: {len(plans)} plans in {elapsed:.2f}s ({len(plans) / elapsed:.1f}/s)")
+    print(f"latency p50 {statistics.median(latencies) * 1000:.0f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f} ms, max {latencies[-1] * 1000:.0f} ms")
+    if stub is not None:
+        print(f"stub: {stub.requests} requests over {stub.connections} TCP connections")
+    lag.sort()
+    print(f"event loop stalls: p99 {lag[int(len(lag) * 0.99) - 1] * 1000:.1f} ms, max {lag[-1] * 1000:.1f} ms over {len(lag)} ticks")
+    print(f"client: {inference_client.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--delay", type=float, default=0.2, help="stub response time in seconds")
+    parser.add_argument("--read-timeout", type=float, default=1.0, help="HF_READ_TIMEOUT_SECONDS for the run")
+    parser.add_argument("--scenario", choices=("ok", "slow-first", "down", "all"), default="all")
+    args = parser.parse_args()
+
+    #Read by app.services.inference_client at import
+    os.environ["HUGGINGFACE_API_TOKEN"] = "stub-token"
+    os.environ["HF_READ_TIMEOUT_SECONDS"] = str(args.read_timeout)
+    #Every request uses the same profile; measure model requests, not the plan cache or coalescing
+    os.environ["PROFILE_CACHE"] = "off"
+    os.environ["COALESCE_GENERATIONS"] = "false"
+
+    for scenario in (("ok", "slow-first", "down") if args.scenario == "all" else (args.scenario,)):
+        asyncio.run(run(args, scenario))
+
+
+if __name__ == "__main__":
+    main()
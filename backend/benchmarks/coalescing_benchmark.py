@@ -0,0 +1,88 @@
+"""
+Model requests for a burst of similar sign-ups, with and without coalescing.
+
+Simulates an onboarding session: --requests generations arrive within --spread
+seconds, drawn from --profiles distinct normalized profiles (ages and weights
+vary inside their buckets). The stub model answers after --delay seconds. The
+plan cache is off, so the only saving comes from sharing in-flight generations.
+
+Usage (from backend/):
+    python -m benchmarks.coalescing_benchmark --requests 60 --profiles 4
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import time
+
+from benchmarks.ai_generation_stub import StubServer
+
+
+async def run(args, coalesce: bool) -> None:
+    from app.models.user import UserProfile
+    from app.services.ai_workout_generator import AIWorkoutGenerator
+    import app.services.ai_workout_generator as generator_module
+    from app.services.inference_client import inference_client
+    from app.services.single_flight import SingleFlight
+
+    flights = SingleFlight(enabled=coalesce)
+    generator_module.generation_flights = flights
+    stub = StubServer(lambda model: (args.delay, 200))
+    inference_client.api_url = f"http://127.0.0.1:{stub.start()}/v1/chat/completions"
+    inference_client.start()
+
+    generator = AIWorkoutGenerator()
+    rng = random.Random(args.seed)
+    goals = ["weight_loss", "muscle_gain", "endurance", "maintenance"]
+    latencies = []
+
+    async def one():
+        await asyncio.sleep(rng.uniform(0, args.spread))
+        kind = rng.randrange(args.profiles)
+        profile = UserProfile(
+            age=rng.randint(30, 39), weight=rng.uniform(70, 79.9), height=175, fitness_level="beginner",
+            goal=goals[kind % len(goals)], available_equipment=["Mat", "dumbbells"],
+            workout_duration=40, days_per_week=3 + kind // len(goals)
+        )
+        started = time.perf_counter()
+        plan = await generator.generate_workout_plan(profile)
+        latencies.append(time.perf_counter() - started)
+        return plan.id
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ids = await asyncio.gather(*(one() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    await inference_client.stop()
+
+    latencies.sort()
+    stats = flights.stats()
+    print(f"\n== {'coalesced' if coalesce else 'independent'}: {len(ids)} plans ({len(set(ids))} ids) in {elapsed:.2f}s")
+    print(f"model requests: {stub.requests}, latency p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+          f"max {latencies[-1] * 1000:.0f} ms")
+    print(f"coalescing: {stats['executions']} generations for {stats['calls']} calls, "
+          f"ratio {stats['coalescing_ratio']}, largest group {stats['max_waiters']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--profiles", type=int, default=4, help="distinct normalized profiles, up to 8")
+    parser.add_argument("--spread", type=float, default=3.0, help="seconds over which requests arrive")
+    parser.add_argument("--delay", type=float, default=1.5, help="model latency in seconds")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    #Read by app.services at import
+    os.environ["HUGGINGFACE_API_TOKEN"] = "stub-token"
+    os.environ["PROFILE_CACHE"] = "off"
+    os.environ.setdefault("HF_MAX_CONNECTIONS", str(args.requests * 2))
+
+    for coalesce in (False, True):
+        asyncio.run(run(args, coalesce))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Load test: concurrent request throughput with the old sync session vs the async session.
+
+Each simulated request runs the leaderboard query (optionally padded with pg_sleep to
+mimic a slow scan). The sync variant calls a blocking Session from inside a coroutine,
+exactly like the old `async def` routes did, so every query stalls the event loop.
+Run it against Postgres: an in-process SQLite file has no I/O wait to overlap, so the
+async driver only shows its thread hand-off overhead there.
+
+Usage (from backend/):
+    python -m benchmarks.db_load_test --concurrency 1 10 50 --requests 200 --sleep 0.02
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.database import DATABASE_URL, to_async_url
+from app.models.db_models import User, UserProgress
+
+LEADERBOARD_QUERY = select(
+    User.username,
+    UserProgress.level,
+    UserProgress.current_exp,
+    UserProgress.total_exercises_completed,
+    User.id
+).join(
+    UserProgress, User.id == UserProgress.user_id
+).order_by(
+    UserProgress.level.desc(),
+    UserProgress.current_exp.desc()
+)
+
+def sync_url(url: str) -> str:
+    if url.startswith("postgres://"):
+        return "postgresql://" + url[len("postgres://"):]
+    return url
+
+async def run_sync(session_factory, concurrency: int, total: int, sleep: float) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def handler():
+        async with semaphore:
+            #Blocking calls inside a coroutine - this is what the old routes did
+            with session_factory() as db:
+                if sleep:
+                    db.execute(text("SELECT pg_sleep(:s)"), {"s": sleep})
+                db.execute(LEADERBOARD_QUERY).all()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(handler() for _ in range(total)))
+    return time.perf_counter() - start
+
+async def run_async(session_factory, concurrency: int, total: int, sleep: float) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def handler():
+        async with semaphore:
+            async with session_factory() as db:
+                if sleep:
+                    await db.execute(text("SELECT pg_sleep(:s)"), {"s": sleep})
+                (await db.execute(LEADERBOARD_QUERY)).all()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(handler() for _ in range(total)))
+    return time.perf_counter() - start
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--sleep", type=float, default=0.0, help="pg_sleep seconds per request (Postgres only)")
+    args = parser.parse_args()
+
+    url = os.getenv("DATABASE_URL", DATABASE_URL)
+    #Give both variants enough connections that the pool is never the bottleneck
+    engine_kwargs = {"pool_size": max(args.concurrency)} if not url.startswith("sqlite") else {}
+
+    sync_engine = create_engine(sync_url(url), **engine_kwargs)
+    async_engine = create_async_engine(to_async_url(url), **engine_kwargs)
+    sync_sessions = sessionmaker(bind=sync_engine)
+    async_sessions = async_sessionmaker(async_engine)
+
+    print(f"{'concurrency':>11} | {'sync req/s':>10} | {'async req/s':>11} | speedup")
+    for concurrency in args.concurrency:
+        sync_elapsed = await run_sync(sync_sessions, concurrency, args.requests, args.sleep)
+        async_elapsed = await run_async(async_sessions, concurrency, args.requests, args.sleep)
+        sync_rps = args.requests / sync_elapsed
+        async_rps = args.requests / async_elapsed
+        print(f"{concurrency:>11} | {sync_rps:>10.1f} | {async_rps:>11.1f} | {async_rps / sync_rps:.2f}x")
+
+    sync_engine.dispose()
+    await async_engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+"""
+Tail latency of AI plan generation, sequential vs hedged model requests.
+
+Runs the generator against the fake chat-completions server from
+benchmarks.ai_generation_stub with injected delays: every request takes a
+log-normal time around --median seconds, --stall-rate of them hang for --stall
+seconds and --error-rate answer 500. The same seeded delays are replayed for both
+modes, so the only difference is whether slow attempts get hedged.
+
+Usage (from backend/):
+    python -m benchmarks.hedging_benchmark --requests 300 --concurrency 20
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import time
+
+from benchmarks.ai_generation_stub import StubServer
+
+
+class InjectedDelays:
+    def __init__(self, args, seed: int):
+        self.args = args
+        self.random = random.Random(seed)
+
+    def __call__(self, model: str):
+        roll = self.random.random()
+        if roll < self.args.error_rate:
+            return self.random.uniform(0.05, 0.2), 500
+        if roll < self.args.error_rate + self.args.stall_rate:
+            return self.args.stall, 200
+        return self.random.lognormvariate(0, 0.35) * self.args.median, 200
+
+
+def percentile(ordered: list, p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+async def run(args, hedged: bool) -> None:
+    from app.models.user import UserProfile
+    from app.services.ai_workout_generator import AIWorkoutGenerator
+    from app.services.hedging import HedgePolicy
+    import app.services.ai_workout_generator as generator_module
+    from app.services.inference_client import inference_client
+
+    policy = HedgePolicy(
+        enabled=hedged, percentile=args.percentile, initial_delay=args.initial_delay, min_delay=0.2,
+        window=200, min_samples=20, max_inflight=2
+    )
+    generator_module.hedge_policy = policy
+    stub = StubServer(InjectedDelays(args, args.seed))
+    inference_client.api_url = f"http://127.0.0.1:{stub.start()}/v1/chat/completions"
+    inference_client.start()
+
+    generator = AIWorkoutGenerator()
+    profile = UserProfile(
+        age=30, weight=70, height=175, fitness_level="beginner", goal="maintenance",
+        available_equipment=[], workout_duration=40, days_per_week=3
+    )
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await generator.generate_workout_plan(profile)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(one() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    await inference_client.stop()
+
+    latencies.sort()
+    stats = policy.stats()
+    print(f"\n== {'hedged' if hedged else 'sequential'}: {len(latencies)} plans in {elapsed:.1f}s")
+    print("latency ms: " + ", ".join(
+        f"p{p} {percentile(latencies, p) * 1000:.0f}" for p in (50, 90, 95, 99)
+    ) + f", max {latencies[-1] * 1000:.0f}")
+    print(f"model requests: {stub.requests} ({stub.requests / len(latencies):.2f} per plan), "
+          f"{stub.cancelled} cancelled by the client")
+    print(f"hedges: {stats['hedges']} launched, {stats['hedge_wins']} won, "
+          f"{stats['failovers']} failovers, final delay {stats['delay_seconds'] or '-'}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--median", type=float, default=0.4, help="typical model latency in seconds")
+    parser.add_argument("--stall", type=float, default=6.0, help="latency of a stalled request")
+    parser.add_argument("--stall-rate", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--percentile", type=float, default=95)
+    parser.add_argument("--initial-delay", type=float, default=2.0, help="hedge delay before 20 samples exist")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    #Read by app.services.inference_client at import
+    os.environ["HUGGINGFACE_API_TOKEN"] = "stub-token"
+    os.environ.setdefault("HF_READ_TIMEOUT_SECONDS", "30")
+    #Every request uses the same profile; measure model requests, not the plan cache or coalescing
+    os.environ["PROFILE_CACHE"] = "off"
+    os.environ["COALESCE_GENERATIONS"] = "false"
+    #Room for a hedge next to every generation, as a production pool should have
+    os.environ.setdefault("HF_MAX_CONNECTIONS", str(args.concurrency * 2))
+
+    for hedged in (False, True):
+        asyncio.run(run(args, hedged))
+
+
+if __name__ == "__main__":
+    main()
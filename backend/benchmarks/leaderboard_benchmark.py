@@ -0,0 +1,132 @@
+"""
+Benchmark: leaderboard latency at 100k and 1M users.
+
+For each size, fills a scratch database with random progress and times:
+  - full scan: the old query that loads every user and ranks them in Python
+  - top-K:     load_top() (LIMIT over ix_user_progress_rank)
+  - rank:      load_user_rank() for a user in the middle of the board
+  - page:      load_after() for the 50 rows following that user (a keyset page N/2 deep)
+  - index:     the same two lookups against the in-memory RankIndex (plus its warm-up time)
+
+By default every size gets a fresh SQLite file in a temp directory. Pass
+--database-url to use Postgres instead; its tables are DROPPED and recreated,
+so only point it at a throwaway database.
+
+Usage (from backend/):
+    python -m benchmarks.leaderboard_benchmark --sizes 100000 1000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.database import Base, to_async_url
+from app.models.db_models import User, UserProgress
+from app.services.leaderboard import load_top, load_user_rank, load_after
+from app.services.rank_index import RankIndex
+
+def populate(sync_url: str, users: int, seed: int) -> None:
+    engine = create_engine(sync_url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    rng = random.Random(seed)
+    batch = 20_000
+    with engine.begin() as conn:
+        for start in range(1, users + 1, batch):
+            ids = range(start, min(start + batch, users + 1))
+            conn.execute(insert(User), [
+                {"id": i, "email": f"user{i}@bench.local", "username": f"user{i}", "hashed_password": "x"}
+                for i in ids
+            ])
+            conn.execute(insert(UserProgress), [
+                {"user_id": i, "level": rng.randint(1, 30), "current_exp": rng.randint(0, 5000),
+                 "total_exercises_completed": rng.randint(0, 2000)}
+                for i in ids
+            ])
+    engine.dispose()
+
+async def timed(fn, repeat: int) -> float:
+    """Median milliseconds over `repeat` runs"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+async def bench(url: str, users: int, repeat: int, full_scan: bool) -> dict:
+    engine = create_async_engine(to_async_url(url))
+    sessions = async_sessionmaker(engine)
+    target_user = users // 2
+
+    async with sessions() as db:
+        async def old_full_scan():
+            result = await db.execute(
+                select(User.username, UserProgress.level, UserProgress.current_exp,
+                       UserProgress.total_exercises_completed, User.id)
+                .join(UserProgress, User.id == UserProgress.user_id)
+                .order_by(UserProgress.level.desc(), UserProgress.current_exp.desc())
+            )
+            rows = result.all()
+            return next(i for i, row in enumerate(rows, start=1) if row.id == target_user)
+
+        _, row = await load_user_rank(db, target_user)
+        key = (row.level, row.current_exp, row.user_id)
+        timings = {
+            "top": await timed(lambda: load_top(db, 10), repeat),
+            "rank": await timed(lambda: load_user_rank(db, target_user), repeat),
+            "page": await timed(lambda: load_after(db, key, 50), repeat),
+        }
+        if full_scan:
+            timings["full"] = await timed(old_full_scan, max(1, repeat // 10))
+
+        start = time.perf_counter()
+        result = await db.execute(
+            select(UserProgress.user_id, User.username, UserProgress.level,
+                   UserProgress.current_exp, UserProgress.total_exercises_completed)
+            .join(User, User.id == UserProgress.user_id)
+        )
+        index = RankIndex(enabled=False, sync_interval=0, check_interval=0)
+        index._load(result.all())
+        timings["warm"] = (time.perf_counter() - start) * 1000
+
+        async def index_top():
+            return index.top(10)
+
+        async def index_rank():
+            return index.rank(target_user)
+
+        timings["index_top"] = await timed(index_top, repeat)
+        timings["index_rank"] = await timed(index_rank, repeat)
+
+    await engine.dispose()
+    return timings
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--database-url", help="throwaway database to use instead of temp SQLite files")
+    parser.add_argument("--skip-full-scan", action="store_true", help="do not time the old O(N) query")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'users':>10} | {'full scan ms':>12} | {'top-10 ms':>9} | {'rank ms':>8} | {'page ms':>8} | "
+          f"{'index warm ms':>13} | {'index top-10 ms':>15} | {'index rank ms':>13}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for users in args.sizes:
+            url = args.database_url or f"sqlite:///{os.path.join(tmp, f'leaderboard_{users}.db')}"
+            populate(url, users, args.seed)
+            timings = await bench(url, users, args.repeat, not args.skip_full_scan)
+            full = f"{timings['full']:12.1f}" if "full" in timings else f"{'-':>12}"
+            print(f"{users:>10,} | {full} | {timings['top']:9.2f} | {timings['rank']:8.2f} | {timings['page']:8.2f} | "
+                  f"{timings['warm']:13.0f} | {timings['index_top']:15.4f} | {timings['index_rank']:13.4f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
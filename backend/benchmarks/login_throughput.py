@@ -0,0 +1,48 @@
+"""
+Benchmark: logins/sec against password pool size.
+
+Fires a burst of concurrent bcrypt verifications (the CPU cost of one login) through
+PasswordHashPool for each pool size and reports throughput and rejections.
+
+Usage (from backend/):
+    python -m benchmarks.login_throughput --sizes 1 2 4 8 --logins 200 --queue 64
+"""
+import argparse
+import asyncio
+import time
+
+from app.auth import get_password_hash, verify_password
+from app.password_pool import PasswordHashPool, PoolSaturatedError
+
+async def burst(pool: PasswordHashPool, hashed: str, logins: int):
+    async def login():
+        try:
+            return await pool.run(verify_password, "correct horse battery staple", hashed)
+        except PoolSaturatedError:
+            return None
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    accepted = sum(1 for r in results if r is not None)
+    return accepted, elapsed
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--queue", type=int, default=1000, help="max queued jobs per pool")
+    parser.add_argument("--kind", choices=["thread", "process"], default="thread")
+    args = parser.parse_args()
+
+    hashed = get_password_hash("correct horse battery staple")
+
+    print(f"{'pool size':>9} | {'logins/s':>8} | {'accepted':>8} | {'rejected':>8}")
+    for size in args.sizes:
+        pool = PasswordHashPool(workers=size, max_queue=args.queue, kind=args.kind)
+        accepted, elapsed = await burst(pool, hashed, args.logins)
+        pool.shutdown()
+        print(f"{size:>9} | {accepted / elapsed:>8.1f} | {accepted:>8} | {pool.rejected:>8}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
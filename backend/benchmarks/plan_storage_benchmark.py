@@ -0,0 +1,81 @@
+"""
+Benchmark: stored size and decode time of workout plans, JSON column vs packed.
+
+Builds plans with the fallback generator across a spread of profiles and compares
+  - json:   the text the old JSON plan_data column stored (json.dumps)
+  - packed: app.services.plan_codec (zstd over msgpack, one frame per day)
+for stored bytes, decoding a whole plan, and reading a single day (the JSON column
+has to parse the whole plan for that; the packed plan decodes one frame).
+
+Usage (from backend/):
+    python -m benchmarks.plan_storage_benchmark
+"""
+import argparse
+import itertools
+import json
+import statistics
+import time
+
+from app.models.user import UserProfile
+from app.services.fallback_workout_generator import FallbackWorkoutGenerator
+from app.services.plan_codec import pack, unpack, unpack_day
+
+def build_plans():
+    generator = FallbackWorkoutGenerator()
+    plans = []
+    for level, goal, days, duration in itertools.product(
+        ("beginner", "intermediate", "advanced"),
+        ("weight_loss", "muscle_gain", "maintenance", "endurance"),
+        (3, 4, 5, 6),
+        (30, 45, 60)
+    ):
+        profile = UserProfile(
+            age=30, weight=70, height=175, fitness_level=level, goal=goal,
+            available_equipment=[], workout_duration=duration, days_per_week=days
+        )
+        plans.append(generator.generate_workout_plan(profile).model_dump(mode="json"))
+    return plans
+
+def per_plan_us(fn, items, repeat: int) -> float:
+    """Median microseconds per item over `repeat` passes"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        samples.append((time.perf_counter() - start) / len(items) * 1e6)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    plans = build_plans()
+    as_json = [json.dumps(plan) for plan in plans]
+    as_packed = [pack(plan) for plan in plans]
+    assert all(unpack(blob) == plan for blob, plan in zip(as_packed, plans))
+
+    json_bytes = sum(len(text.encode()) for text in as_json)
+    packed_bytes = sum(len(blob) for blob in as_packed)
+    print(f"{len(plans)} plans, {statistics.mean(len(plan['weekly_schedule']) for plan in plans):.1f} days each on average")
+    print(f"{'':>18} | {'json':>10} | {'packed':>10}")
+    print(f"{'bytes per plan':>18} | {json_bytes / len(plans):10.0f} | {packed_bytes / len(plans):10.0f}"
+          f"  ({packed_bytes / json_bytes:.0%} of json)")
+
+    full_json = per_plan_us(json.loads, as_json, args.repeat)
+    full_packed = per_plan_us(unpack, as_packed, args.repeat)
+    print(f"{'whole plan, us':>18} | {full_json:10.1f} | {full_packed:10.1f}")
+
+    def json_day(text):
+        return next(day for day in json.loads(text)["weekly_schedule"] if day["day"] == 2)
+
+    day_json = per_plan_us(json_day, as_json, args.repeat)
+    day_packed = per_plan_us(lambda blob: unpack_day(blob, 2), as_packed, args.repeat)
+    print(f"{'one day, us':>18} | {day_json:10.1f} | {day_packed:10.1f}")
+
+    encode = per_plan_us(pack, plans, args.repeat)
+    print(f"{'encode, us':>18} | {per_plan_us(json.dumps, plans, args.repeat):10.1f} | {encode:10.1f}")
+
+if __name__ == "__main__":
+    main()
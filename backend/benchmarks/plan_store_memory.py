@@ -0,0 +1,65 @@
+"""
+Benchmark: worker memory under sustained plan generation.
+
+Generates --plans fallback plans (no network) and keeps them the way /generate-workout
+used to (a plain dict) and in the memory tier of the plan store, reporting the
+Python heap held by each every --step plans.
+
+Usage (from backend/):
+    python -m benchmarks.plan_store_memory --plans 20000
+"""
+import argparse
+import gc
+import tracemalloc
+import uuid
+
+from app.models.user import UserProfile
+from app.services.fallback_workout_generator import FallbackWorkoutGenerator
+from app.services.plan_store import MemoryPlanStore
+
+PROFILE = UserProfile(
+    age=30, weight=70, height=175, fitness_level="beginner", goal="weight_loss",
+    available_equipment=["dumbbells"], workout_duration=45, days_per_week=4
+)
+
+def held_mb(fn) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    keep = fn()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del keep
+    return (after - before) / 1024 / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plans", type=int, default=20_000)
+    parser.add_argument("--step", type=int, default=5_000)
+    parser.add_argument("--cache-size", type=int, default=1_000)
+    args = parser.parse_args()
+
+    template = FallbackWorkoutGenerator().generate_workout_plan(PROFILE)
+
+    def plans(count):
+        #Fresh copies so nothing is shared between stored plans
+        for _ in range(count):
+            yield template.model_copy(deep=True, update={"id": str(uuid.uuid4())})
+
+    print(f"{'plans':>8} | {'dict MB':>8} | {'plan store MB':>13}")
+    for count in range(args.step, args.plans + 1, args.step):
+        def unbounded():
+            return {plan.id: plan for plan in plans(count)}
+
+        def bounded():
+            store = MemoryPlanStore(maxsize=args.cache_size, ttl=3600)
+            for plan in plans(count):
+                #MemoryPlanStore.put() without the event loop
+                store.cache.set(plan.id, plan)
+            return store
+
+        print(f"{count:>8,} | {held_mb(unbounded):8.1f} | {held_mb(bounded):13.1f}")
+
+if __name__ == "__main__":
+    main()
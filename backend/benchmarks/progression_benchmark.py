@@ -0,0 +1,57 @@
+"""
+Benchmark: recompute levels for a million users.
+
+Compares the old level-by-level loop (processLevelUp in progressSystem.js, ported
+to Python) with the closed-form vectorized recompute in app.services.progression.
+
+Usage (from backend/):
+    python -m benchmarks.progression_benchmark --users 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.services.progression import exp_for_level, recompute_progress_array
+
+def process_level_up(level: int, exp: int):
+    """The original iterative rule, kept here as the baseline"""
+    exp_to_next_level = exp_for_level(level)
+    while exp >= exp_to_next_level:
+        exp -= exp_to_next_level
+        level += 1
+        exp_to_next_level = exp_for_level(level)
+    return level, exp, exp_to_next_level
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--max-exp", type=int, default=5_000_000, help="upper bound of random unsettled EXP per user")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    levels = rng.integers(1, 20, size=args.users)
+    exps = rng.integers(0, args.max_exp, size=args.users)
+
+    start = time.perf_counter()
+    new_levels, new_exps, new_next = recompute_progress_array(levels, exps)
+    vectorized = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = [process_level_up(int(level), int(exp)) for level, exp in zip(levels, exps)]
+    iterative = time.perf_counter() - start
+
+    mismatches = sum(
+        1 for i, row in enumerate(expected)
+        if row != (new_levels[i], new_exps[i], new_next[i])
+    )
+
+    print(f"users:              {args.users:,}")
+    print(f"iterative loop:     {iterative:8.3f}s  ({args.users / iterative:,.0f} users/s)")
+    print(f"closed-form numpy:  {vectorized:8.3f}s  ({args.users / vectorized:,.0f} users/s)")
+    print(f"speedup:            {iterative / vectorized:8.1f}x")
+    print(f"mismatches:         {mismatches}")
+
+if __name__ == "__main__":
+    main()
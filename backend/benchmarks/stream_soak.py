@@ -0,0 +1,190 @@
+"""
+Soak test: thousands of idle /stream/ connections against one worker.
+
+Starts a uvicorn worker on a scratch SQLite database (or uses --url), signs up one
+user and opens --connections Server-Sent Events streams with that user's token.
+While they are held open it reports the worker's memory per connection, then makes
+--writes progress writes and times how long each takes to reach every stream.
+Streams that close during the hold are counted as dropped.
+
+Usage (from backend/):
+    python -m benchmarks.stream_soak --connections 2000 --hold 60
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from urllib.parse import urlparse
+
+
+def request(base_url: str, method: str, path: str, body=None, token=None) -> dict:
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, headers=headers, method=method)
+    with urllib.request.urlopen(req) as response:
+        return json.loads(response.read() or b"null")
+
+
+def rss_kb(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+class Stream:
+    def __init__(self):
+        self.progress_events = []  # arrival times
+        self.closed = False
+
+    async def run(self, host: str, port: int, token: str, connected: asyncio.Event) -> None:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(
+            f"GET /stream/ HTTP/1.1\r\nHost: {host}\r\nAuthorization: Bearer {token}\r\n"
+            "Accept: text/event-stream\r\n\r\n".encode()
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        if b" 200 " not in status_line:
+            raise RuntimeError(status_line.decode().strip())
+        connected.set()
+        try:
+            event = None
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.startswith(b"event: "):
+                    event = line[7:].strip()
+                elif line.startswith(b"data: ") and event == b"progress":
+                    self.progress_events.append(time.perf_counter())
+        finally:
+            self.closed = True
+            writer.close()
+
+
+def start_server(port: int, database_url: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "BCRYPT_ROUNDS": "4",
+        "STREAM_TICK_SECONDS": "0.5",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--log-level", "warning", "--timeout-graceful-shutdown", "2",
+         "--limit-concurrency", "100000", "--backlog", "8192"],
+        env=env
+    )
+
+
+def wait_until_up(base_url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            request(base_url, "GET", "/")
+            return
+        except OSError:
+            time.sleep(0.25)
+    raise RuntimeError("server did not start")
+
+
+async def soak(args, base_url: str, server_pid) -> None:
+    host, port = urlparse(base_url).hostname, urlparse(base_url).port
+    email = f"soak{int(time.time())}@example.com"
+    request(base_url, "POST", "/auth/signup", {
+        "email": email, "username": email.split("@")[0], "password": "soak-password",
+        "age": 30, "weight": 70, "height": 175, "fitness_level": "beginner"
+    })
+    token = request(base_url, "POST", "/auth/login", {"email": email, "password": "soak-password"})["access_token"]
+
+    rss_before = rss_kb(server_pid) if server_pid else 0
+    streams = [Stream() for _ in range(args.connections)]
+    tasks = []
+    started = time.perf_counter()
+    failed = 0
+    for i in range(0, args.connections, 200):
+        batch = []
+        for stream in streams[i:i + 200]:
+            connected = asyncio.Event()
+            tasks.append(asyncio.create_task(stream.run(host, port, token, connected)))
+            batch.append(connected.wait())
+        results = await asyncio.gather(*(asyncio.wait_for(wait, 30) for wait in batch), return_exceptions=True)
+        failed += sum(1 for result in results if isinstance(result, Exception))
+    connect_seconds = time.perf_counter() - started
+    await asyncio.sleep(1)
+    rss_after = rss_kb(server_pid) if server_pid else 0
+
+    print(f"connections: {args.connections - failed} open, {failed} failed, {connect_seconds:.1f}s to connect")
+    if server_pid:
+        per_connection = (rss_after - rss_before) / max(args.connections - failed, 1)
+        print(f"worker RSS: {rss_before / 1024:.0f} MB -> {rss_after / 1024:.0f} MB ({per_connection:.1f} KB per connection)")
+
+    latencies = []
+    for write in range(args.writes):
+        expected = write + 1
+        sent = time.perf_counter()
+        await asyncio.to_thread(request, base_url, "POST", "/progress/complete", {
+            "week": 1, "day": 1, "exercise_index": write, "type": "strength", "sets": 3
+        }, token)
+        while any(len(s.progress_events) < expected for s in streams if not s.closed):
+            if time.perf_counter() - sent > 30:
+                break
+            await asyncio.sleep(0.01)
+        arrivals = [s.progress_events[write] - sent for s in streams if len(s.progress_events) >= expected]
+        latencies.append(max(arrivals) * 1000 if arrivals else float("nan"))
+        print(f"write {expected}: reached {len(arrivals)} streams, last after {latencies[-1]:.0f} ms")
+
+    remaining = args.hold - (time.perf_counter() - started)
+    if remaining > 0:
+        await asyncio.sleep(remaining)
+    dropped = sum(1 for stream in streams if stream.closed)
+    print(f"after {args.hold}s hold: {dropped} streams dropped")
+    if latencies:
+        print(f"fan-out to all streams: median {statistics.median(latencies):.0f} ms, max {max(latencies):.0f} ms")
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=2000)
+    parser.add_argument("--hold", type=float, default=60, help="seconds to keep the streams open")
+    parser.add_argument("--writes", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--url", help="use an already running server instead of starting one")
+    args = parser.parse_args()
+
+    #Each stream needs a file descriptor on both ends
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, args.connections * 2 + 256)), hard))
+
+    if args.url:
+        asyncio.run(soak(args, args.url.rstrip("/"), None))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base_url = f"http://127.0.0.1:{args.port}"
+        server = start_server(args.port, f"sqlite:///{os.path.join(tmp, 'soak.db')}")
+        try:
+            wait_until_up(base_url)
+            asyncio.run(soak(args, base_url, server.pid))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()